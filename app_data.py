@@ -0,0 +1,100 @@
+import re
+import threading
+
+import settings
+from dataset import bins
+from instrumentation import timed
+from refresh import Refresher
+from sampling import draw_sample
+
+
+class AppData:
+    # The dataset a dashboard reads: the refreshed cube and, for progressive rendering, the
+    # sample. Both are loaded on first use or by an explicit warm-up, so importing a dashboard
+    # (e.g. to check its layout, or to answer health checks right after boot) reads no data.
+
+    def __init__(self):
+        self.refresher = None
+        self.stratified_sample = None
+        # Bumped whenever a refresh replaces the data, so a sample drawn from the old data is not kept
+        self.sample_generation = 0
+        # Called with every new cube once the refresher has swapped it in
+        self.listeners = []
+        self.lock = threading.Lock()
+        # Held while drawing, so concurrent first requests draw the sample once
+        self.sample_lock = threading.Lock()
+
+    def load(self):
+        if self.refresher is None:
+            with self.lock:
+                if self.refresher is None:
+                    with timed('load data'):
+                        refresher = Refresher()
+                        refresher.cube.warm()
+                    self.listeners.insert(0, self.drop_sample)
+                    refresher.listeners = self.listeners
+                    refresher.start(settings.REFRESH_INTERVAL)
+                    self.refresher = refresher
+        return self.refresher
+
+    @property
+    def cube(self):
+        return self.load().cube
+
+    def drop_sample(self, cube):
+        # The sample no longer matches the refreshed cube: draw it again on next use
+        with self.lock:
+            self.sample_generation += 1
+            self.stratified_sample = None
+
+    @property
+    def sample(self):
+        sample = self.stratified_sample
+        if sample is None:
+            with self.sample_lock:
+                sample = self.stratified_sample
+                if sample is None:
+                    generation = self.sample_generation
+                    with timed('draw sample'):
+                        sample = draw_sample()
+                    with self.lock:
+                        if generation == self.sample_generation:
+                            self.stratified_sample = sample
+        return sample
+
+
+# The one dataset every dashboard in the process reads: pre-aggregated into sums and counts,
+# so callbacks roll up cells instead of rows, loaded on first use or by a dashboard's warm_up(),
+# and refreshed as new transactions arrive
+data = AppData()
+
+# Groups of both dashboards' bubble plots
+ITEM_GROUPS = ['Item Purchased', 'Category']
+
+
+def item_rollup(cells, previous_purchases='total'):
+    # Average rating and purchase amount per item, with previous purchases summed ('total') or
+    # averaged ('mean')
+    averaged = ['Review Rating', 'Purchase Amount (USD)']
+    if previous_purchases == 'mean':
+        return cells.rollup(ITEM_GROUPS, mean=averaged + ['Previous Purchases'])
+    return cells.rollup(ITEM_GROUPS, mean=averaged, total=['Previous Purchases'])
+
+
+# Width in years of the default age groups
+AGE_BIN_WIDTH = bins[1] - bins[0]
+
+# Largest custom edge taken; larger numbers typed in the edges box are not ages and are ignored
+MAX_AGE = 150
+
+
+def age_edges(bin_width=AGE_BIN_WIDTH, custom_edges=None):
+    # Edges of the age groups: custom ones typed as a list of ages when at least two are given,
+    # otherwise every bin_width years over the range of the default groups
+    if custom_edges:
+        # Compared as floats, which any run of digits converts to, if only to inf
+        edges = sorted({int(age) for age in re.findall(r'\d+', custom_edges) if float(age) <= MAX_AGE})
+        if len(edges) >= 2:
+            return edges
+    bin_width = int(bin_width or AGE_BIN_WIDTH)
+    return list(range(bins[0], bins[-1] + bin_width, bin_width))
@@ -0,0 +1,333 @@
+// Charts redrawn in the browser from pre-aggregated cells: the age/gender charts from the
+// 'age-gender-cells' store, and the map, bar, pie and bubble charts from the 'chart-cells' store,
+// so gender, season and state changes do not need a server round trip
+
+// Display order of checklist values, as in figure_cache.VALUE_ORDER
+var VALUE_ORDER = ['Winter', 'Spring', 'Summer', 'Fall', 'Male', 'Female', 'Overall'];
+
+// Largest marker size of plotly express bubble charts, as in figure_templates.SIZE_MAX
+var SIZE_MAX = 20;
+
+// Edges of the age groups, as in app_data.age_edges: custom ones up to maxAge when at least two
+// ages are typed, otherwise every binWidth years over the range of the default groups
+function ageEdges(cells, binWidth, customEdges) {
+    var custom = (customEdges || '').match(/\d+/g) || [];
+    var edges = custom.map(Number).filter(function (age) {
+        return age <= cells.maxAge;
+    }).filter(function (age, i, ages) {
+        return ages.indexOf(age) === i;
+    }).sort(function (a, b) {
+        return a - b;
+    });
+    if (edges.length >= 2) return edges;
+    binWidth = binWidth || cells.binWidth;
+    edges = [];
+    for (var age = cells.ageStart; age < cells.ageStop + binWidth; age += binWidth) edges.push(age);
+    return edges;
+}
+
+// Average review rating per gender (and overall) and age group over the selected cells, adding up
+// the single-year ages of each group
+function averageByAgeGender(cells, seasons, state, genders, edges) {
+    var labels = [];
+    for (var g = 0; g + 1 < edges.length; g++) {
+        labels.push(edges[g + 1] - edges[g] > 1 ? edges[g] + '-' + (edges[g + 1] - 1) : String(edges[g]));
+    }
+    var sums = {};
+    var counts = {};
+    for (var i = 0; i < cells.sum.length; i++) {
+        if (seasons.indexOf(cells.season[i]) < 0) continue;
+        if (state && cells.state[i] !== state) continue;
+        if (genders && genders.indexOf(cells.gender[i]) < 0) continue;
+        var group = 0;
+        while (group < labels.length && cells.age[i] >= edges[group + 1]) group++;
+        if (cells.age[i] < edges[0] || group === labels.length) continue;
+        [cells.gender[i], 'Overall'].forEach(function (gender) {
+            var key = gender + '|' + labels[group];
+            sums[key] = (sums[key] || 0) + cells.sum[i];
+            counts[key] = (counts[key] || 0) + cells.count[i];
+        });
+    }
+    return function (gender) {
+        var x = [];
+        var y = [];
+        labels.forEach(function (age) {
+            var key = gender + '|' + age;
+            if (counts[key]) {
+                x.push(age);
+                y.push(sums[key] / counts[key]);
+            }
+        });
+        return {x: x, y: y};
+    };
+}
+
+// Fill the reference traces, in their original order, for the selected genders
+function buildFigure(cells, average, genders) {
+    var data = [];
+    Object.keys(cells.traces).forEach(function (gender) {
+        if (genders.indexOf(gender) < 0) return;
+        var points = average(gender);
+        if (points.x.length) {
+            data.push(Object.assign({}, cells.traces[gender], points));
+        }
+    });
+    return {data: data, layout: cells.layout};
+}
+
+// A selection without duplicates in the order the server sees it, as in figure_cache.canonical
+function canonical(values) {
+    function orderKey(value) {
+        var position = VALUE_ORDER.indexOf(value);
+        return position >= 0 ? [0, position, ''] : [1, 0, String(value)];
+    }
+    return (values || []).filter(function (value, i, all) {
+        return all.indexOf(value) === i;
+    }).sort(function (a, b) {
+        var keyA = orderKey(a);
+        var keyB = orderKey(b);
+        for (var i = 0; i < keyA.length; i++) {
+            if (keyA[i] !== keyB[i]) return keyA[i] < keyB[i] ? -1 : 1;
+        }
+        return 0;
+    });
+}
+
+// Sums of the cells of the selected seasons and state per group of the columns in by, ordered
+// like the server's roll-ups by the codes of those columns. Cells missing a group value are left
+// out, as in a pandas groupby. Each row holds its group labels and its sums.
+function rollupCells(cells, seasons, state, by) {
+    var groups = cells.groups;
+    var seasonCodes = seasons.map(function (season) {
+        return groups.Season.labels.indexOf(season);
+    }).filter(function (code) {
+        return code >= 0;
+    });
+    var stateCode = state ? groups.state_abbr.labels.indexOf(state) : null;
+    var columns = Object.keys(cells.sums);
+    var rows = {};
+    for (var i = 0; i < groups.Season.codes.length; i++) {
+        if (seasonCodes.indexOf(groups.Season.codes[i]) < 0) continue;
+        if (state && (stateCode < 0 || groups.state_abbr.codes[i] !== stateCode)) continue;
+        var codes = by.map(function (column) {
+            return groups[column].codes[i];
+        });
+        if (codes.indexOf(-1) >= 0) continue;
+        var key = codes.join('|');
+        if (!rows[key]) {
+            rows[key] = {codes: codes, sums: {}};
+            columns.forEach(function (column) {
+                rows[key].sums[column] = 0;
+            });
+        }
+        columns.forEach(function (column) {
+            rows[key].sums[column] += cells.sums[column][i];
+        });
+    }
+    return Object.keys(rows).map(function (key) {
+        return rows[key];
+    }).sort(function (a, b) {
+        for (var i = 0; i < a.codes.length; i++) {
+            if (a.codes[i] !== b.codes[i]) return a.codes[i] - b.codes[i];
+        }
+        return 0;
+    }).map(function (row) {
+        by.forEach(function (column, i) {
+            row[column] = groups[column].labels[row.codes[i]];
+        });
+        return row;
+    });
+}
+
+// A column of roll-up rows: a group label, a measure's total when listed in totals, or otherwise
+// its mean, the sum over the non-null count
+function values(rows, column, totals) {
+    return rows.map(function (row) {
+        if (column in row) return row[column];
+        if (totals && totals.indexOf(column) >= 0) return row.sums[column];
+        return row.sums[column] / row.sums[column + ' count'];
+    });
+}
+
+function finite(numbers) {
+    return numbers.filter(function (number) {
+        return !isNaN(number);
+    });
+}
+
+// A copy of nested objects with dotted paths set, as in figure_templates.with_paths
+function withPaths(tree, paths) {
+    tree = Object.assign({}, tree);
+    Object.keys(paths).forEach(function (path) {
+        var node = tree;
+        var keys = path.split('.');
+        keys.slice(0, -1).forEach(function (parent) {
+            node[parent] = Object.assign({}, node[parent]);
+            node = node[parent];
+        });
+        node[keys[keys.length - 1]] = paths[path];
+    });
+    return tree;
+}
+
+// The group-specific strings of a trace, renamed from the prototype's group, as in
+// FigureTemplate.relabel
+function relabel(prototype, value) {
+    var paths = {};
+    ['name', 'legendgroup', 'offsetgroup'].forEach(function (key) {
+        if (key in prototype) paths[key] = value;
+    });
+    if ('hovertemplate' in prototype) {
+        var drawn = '=' + prototype.name;
+        var at = prototype.hovertemplate.indexOf(drawn);
+        paths.hovertemplate = prototype.hovertemplate.slice(0, at) + '=' + value +
+            prototype.hovertemplate.slice(at + drawn.length);
+    }
+    return paths;
+}
+
+// The figure of roll-up rows from a chart's server-drawn template, as FigureTemplate.figure
+// builds it: arrays maps trace paths to functions of a group's rows, traces are split by the group
+// column in order of appearance, and no rows give the server's figure of no rows
+function fillTemplate(chart, rows, arrays, group, layout) {
+    if (!rows.length) {
+        return {data: chart.empty.data, layout: withPaths(chart.empty.layout, layout)};
+    }
+    var groups = [];
+    if (group === null) {
+        groups.push({value: null, rows: rows});
+    } else {
+        var found = {};
+        rows.forEach(function (row) {
+            if (!(row[group] in found)) {
+                found[row[group]] = {value: row[group], rows: []};
+                groups.push(found[row[group]]);
+            }
+            found[row[group]].rows.push(row);
+        });
+    }
+    var sizeref = null;
+    if (arrays['marker.size']) {
+        sizeref = Math.max.apply(null, finite(arrays['marker.size'](rows))) / (SIZE_MAX * SIZE_MAX);
+    }
+
+    var data = groups.map(function (trace, position) {
+        var paths = {};
+        Object.keys(arrays).forEach(function (path) {
+            paths[path] = arrays[path](trace.rows);
+        });
+        if (sizeref !== null) paths['marker.sizeref'] = sizeref;
+        if (group !== null) {
+            Object.assign(paths, relabel(chart.trace, trace.value));
+            paths['marker.color'] = Array.isArray(chart.colors) ?
+                chart.colors[position % chart.colors.length] : chart.colors[trace.value];
+        }
+        return withPaths(chart.trace, paths);
+    });
+    return {data: data, layout: withPaths(chart.layout, layout)};
+}
+
+function column(name, totals) {
+    return function (rows) {
+        return values(rows, name, totals);
+    };
+}
+
+// Bubble plot of the average rating and purchase amount per item, from the arrays and totals of
+// its chart in the store
+function bubblePlot(cells, seasons, state) {
+    var chart = cells.charts.bubble;
+    seasons = canonical(seasons);
+    var arrays = {};
+    Object.keys(chart.arrays).forEach(function (path) {
+        arrays[path] = column(chart.arrays[path], chart.total);
+    });
+    return fillTemplate(chart, rollupCells(cells, seasons, state, ['Item Purchased', 'Category']), arrays, 'Category',
+        {'title.text': 'Aggregated Bubble Plot of Shopping Trends for ' + seasons.join(', ')});
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    shopping: {
+        // Line plot of the average review rating by age group and gender in good_visualization
+        scatter_plot: function (cells, seasons, state, genders, binWidth, customEdges) {
+            var edges = ageEdges(cells, binWidth, customEdges);
+            return buildFigure(cells, averageByAgeGender(cells, seasons || [], state, null, edges), genders || []);
+        },
+        // Bar chart of the average review rating by gender and age group in bad_visualization
+        gender_age_bar_chart: function (cells, seasons, genders, binWidth, customEdges) {
+            var edges = ageEdges(cells, binWidth, customEdges);
+            return buildFigure(cells, averageByAgeGender(cells, seasons || [], null, genders || [], edges), genders || []);
+        },
+        // Choropleth map of the average review rating per state in good_visualization
+        choropleth_map: function (cells, seasons, state) {
+            seasons = canonical(seasons);
+            var rows = rollupCells(cells, seasons, state, ['Location', 'state_abbr']);
+            return fillTemplate(cells.charts.map, rows, {
+                locations: column('state_abbr'),
+                z: column('Review Rating'),
+                customdata: function (rows) {
+                    return rows.map(function (row) {
+                        return [row.Location, row.state_abbr];
+                    });
+                }
+            }, null, {'title.text': 'Average Review Ratings by State for ' + seasons.join(', ')});
+        },
+        // Bar chart of the average review rating per item, best first, in good_visualization
+        bar_chart: function (cells, seasons, state) {
+            seasons = canonical(seasons);
+            var rows = rollupCells(cells, seasons, state, ['Item Purchased', 'Category']);
+            var ratings = values(rows, 'Review Rating');
+            // A stable sort on ratings rounded to 9 decimals, missing ratings last, as in build_bar_chart
+            var order = rows.map(function (row, i) {
+                return i;
+            }).sort(function (a, b) {
+                var keyA = Math.round(ratings[a] * 1e9);
+                var keyB = Math.round(ratings[b] * 1e9);
+                if (isNaN(keyA) || isNaN(keyB)) return isNaN(keyA) - isNaN(keyB) || a - b;
+                return keyB - keyA || a - b;
+            });
+            rows = order.map(function (i) {
+                return rows[i];
+            });
+            var rated = finite(ratings);
+            return fillTemplate(cells.charts.bar, rows, {
+                x: column('Review Rating'),
+                y: column('Item Purchased')
+            }, 'Category', {
+                'title.text': 'Average Review Ratings by Item Purchased for ' + seasons.join(', '),
+                'xaxis.range': rated.length ?
+                    [Math.min.apply(null, rated) - 0.1, Math.max.apply(null, rated)] : [NaN, NaN]
+            });
+        },
+        // Bubble plot of the item averages and total previous purchases in good_visualization, and
+        // of the item averages in bad_visualization
+        bubble_plot: bubblePlot,
+        // Bar chart of the average review rating by state and season in bad_visualization
+        state_season_bar_chart: function (cells, seasons, state) {
+            var rows = rollupCells(cells, canonical(seasons), state, ['Location', 'Season']);
+            return fillTemplate(cells.charts.state_season_bar, rows, {
+                x: column('Location'),
+                y: column('Review Rating')
+            }, 'Season', {});
+        },
+        // Pie charts of the average review rating per item, one per season, in bad_visualization
+        season_item_pie_charts: function (cells, seasons, state) {
+            var grid = cells.charts.pie;
+            var rows = rollupCells(cells, canonical(seasons), state, ['Season', 'Item Purchased']);
+            var data = [];
+            var bySeason = {};
+            rows.forEach(function (row) {
+                if (!(row.Season in bySeason)) {
+                    bySeason[row.Season] = [];
+                    data.push({domain: grid.domains[data.length], name: row.Season, type: 'pie'});
+                }
+                bySeason[row.Season].push(row);
+            });
+            data.forEach(function (trace) {
+                trace.labels = values(bySeason[trace.name], 'Item Purchased');
+                trace.values = values(bySeason[trace.name], 'Review Rating');
+            });
+            return {data: data, layout: grid.layout};
+        }
+    }
+});
@@ -1,261 +1,428 @@
-
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import dash
-from dash import dcc, html
-from dash.dependencies import Input, Output
-
-# Load the dataset
-df = pd.read_csv('shopping_trends_updated.csv')
-
-# Mapping full state names to their abbreviations
-state_abbrev = {
-    'Alabama': 'AL', 'Alaska': 'AK', 'Arizona': 'AZ', 'Arkansas': 'AR',
-    'California': 'CA', 'Colorado': 'CO', 'Connecticut': 'CT', 'Delaware': 'DE',
-    'Florida': 'FL', 'Georgia': 'GA', 'Hawaii': 'HI', 'Idaho': 'ID',
-    'Illinois': 'IL', 'Indiana': 'IN', 'Iowa': 'IA', 'Kansas': 'KS',
-    'Kentucky': 'KY', 'Louisiana': 'LA', 'Maine': 'ME', 'Maryland': 'MD',
-    'Massachusetts': 'MA', 'Michigan': 'MI', 'Minnesota': 'MN', 'Mississippi': 'MS',
-    'Missouri': 'MO', 'Montana': 'MT', 'Nebraska': 'NE', 'Nevada': 'NV',
-    'New Hampshire': 'NH', 'New Jersey': 'NJ', 'New Mexico': 'NM', 'New York': 'NY',
-    'North Carolina': 'NC', 'North Dakota': 'ND', 'Ohio': 'OH', 'Oklahoma': 'OK',
-    'Oregon': 'OR', 'Pennsylvania': 'PA', 'Rhode Island': 'RI', 'South Carolina': 'SC',
-    'South Dakota': 'SD', 'Tennessee': 'TN', 'Texas': 'TX', 'Utah': 'UT',
-    'Vermont': 'VT', 'Virginia': 'VA', 'Washington': 'WA', 'West Virginia': 'WV',
-    'Wisconsin': 'WI', 'Wyoming': 'WY'
-}
-
-# Add a 'state_abbr' column to the DataFrame
-df['state_abbr'] = df['Location'].map(state_abbrev)
-
-# Bin the ages into 5-year intervals with a range from 15 to 70
-bins = list(range(15, 76, 5))
-labels = [f'{i}-{i+4}' for i in range(15, 71, 5)]
-df['Age Group'] = pd.cut(df['Age'], bins=bins, labels=labels, right=False)
-
-# Calculate the average review rating for each age group and gender
-average_ratings = df.groupby(['Age Group', 'Gender'])['Review Rating'].mean().reset_index()
-
-category_colors = {
-    'Clothing': '#FFEDA0',
-    'Footwear': '#FEB24C',
-    'Accessories': '#FC4E2A',
-    'Outerwear': '#BD0026'
-}
-
-color_package = "OrRd"
-
-font_dict = dict(family="Helvetica, sans-serif", size=18)
-
-# Initialize the Dash app
-app = dash.Dash(__name__)
-
-# App layout
-app.layout = html.Div([
-    html.Div([
-        html.H1("Shopping Trends Dashboard", style={'textAlign': 'center', 'fontFamily': 'Helvetica', 'fontSize': '34px', 'padding': '20px 0'}),
-        html.P(
-            "Explore and analyze customer review ratings, purchase amounts, and trends across different states, seasons, and demographics. Use the filters to customize the visualizations and gain insights into shopping behaviors.",
-            style={'textAlign': 'center', 'fontFamily': 'Helvetica', 'fontSize': '20px', 'maxWidth': '800px', 'margin': '0 auto', 'padding': '10px 0'}
-        )
-    ], style={'backgroundColor': '#f9f9f9', 'padding': '20px', 'borderRadius': '10px', 'boxShadow': '0px 0px 15px rgba(0, 0, 0, 0.1)'}),
-    html.Div([
-        html.H2("Filter Options", style={'textAlign': 'left', 'fontFamily': 'Helvetica', 'fontSize': '28px', 'padding': '10px 0'}),
-        html.Div([
-            html.Div([
-                html.Label("Seasons", style={'fontFamily': 'Helvetica', 'fontSize': '20px'}),
-                dcc.Checklist(
-                    id='season-filter',
-                    options=[{'label': season, 'value': season} for season in df['Season'].unique()],
-                    value=list(df['Season'].unique()),  # Default to show all seasons
-                    inline=True,
-                    style={'fontFamily': 'Helvetica', 'fontSize': '18px'}
-                ),
-            ], style={'flex': '1', 'padding': '10px'}),
-            html.Div([
-                html.Label("State", style={'fontFamily': 'Helvetica', 'fontSize': '20px'}),
-                dcc.Dropdown(
-                    id='state-filter',
-                    options=[{'label': state, 'value': abbrev} for state, abbrev in state_abbrev.items()],
-                    placeholder="Select a state",
-                    clearable=True,
-                    style={'fontFamily': 'Helvetica', 'fontSize': '18px'}
-                ),
-            ], style={'flex': '1', 'padding': '10px'}),
-            html.Div([
-                html.Label("Gender", style={'fontFamily': 'Helvetica', 'fontSize': '20px'}),
-                dcc.Checklist(
-                    id='gender-checklist',
-                    options=[
-                        {'label': 'Male', 'value': 'Male'},
-                        {'label': 'Female', 'value': 'Female'}
-                    ],
-                    value=['Male', 'Female'],
-                    inline=True,
-                    style={'fontFamily': 'Helvetica', 'fontSize': '18px'}
-                ),
-            ], style={'flex': '1', 'padding': '10px'}),
-        ], style={'display': 'flex', 'flexWrap': 'wrap', 'margin': '0 -10px'})
-    ], style={'backgroundColor': '#f9f9f9', 'padding': '20px', 'borderRadius': '10px', 'boxShadow': '0px 0px 15px rgba(0, 0, 0, 0.1)', 'margin': '20px 0'}),
-    html.Div([
-        html.H2("Visualizations", style={'textAlign': 'left', 'fontFamily': 'Helvetica', 'fontSize': '28px', 'padding': '10px 0'}),
-        html.Div([
-            html.P("This bar chart displays the average review ratings by state and season.",
-                   style={'fontFamily': 'Helvetica', 'fontSize': '18px'}),
-            dcc.Graph(id='state-season-bar-chart', style={'width': '100%', 'height': '500px', 'marginBottom': '40px'}),
-        ], style={'padding': '10px'}),
-        html.Div([
-            html.P("These pie charts show the average review ratings for items purchased in each season.",
-                   style={'fontFamily': 'Helvetica', 'fontSize': '18px'}),
-            dcc.Graph(id='season-item-pie-charts', style={'width': '100%', 'height': '1500px', 'marginBottom': '40px'}),  # Adjusted height
-        ], style={'padding': '10px'}),
-        html.Div([
-            html.P("This bubble plot aggregates shopping trends, showing review ratings, purchase amounts, and previous purchases for the selected seasons.",
-                   style={'fontFamily': 'Helvetica', 'fontSize': '18px'}),
-            dcc.Graph(id='bubble-plot', style={'width': '100%', 'height': '500px', 'marginBottom': '40px'}),
-        ], style={'padding': '10px'}),
-        html.Div([
-            html.P("This bar chart shows the average review ratings by gender and age group.",
-                   style={'fontFamily': 'Helvetica', 'fontSize': '18px'}),
-            dcc.Graph(id='gender-age-bar-chart', style={'width': '100%', 'height': '500px', 'marginBottom': '80px'}),  # Added more space
-        ], style={'padding': '10px'})
-    ], style={'backgroundColor': '#f9f9f9', 'padding': '20px', 'borderRadius': '10px', 'boxShadow': '0px 0px 15px rgba(0, 0, 0, 0.1)', 'margin': '20px 0'})
-])
-
-# Callback to update the state-season bar chart
-@app.callback(
-    Output('state-season-bar-chart', 'figure'),
-    [Input('season-filter', 'value'),
-     Input('state-filter', 'value')]
-)
-def update_state_season_bar_chart(selected_seasons, selected_state):
-    # Filter the data based on the selected seasons
-    filtered_df = df[df['Season'].isin(selected_seasons)]
-
-    if selected_state:
-        filtered_df = filtered_df[filtered_df['state_abbr'] == selected_state]
-
-    # Group data by Location (State) and Season
-    state_season_avg_rating = filtered_df.groupby(['Location', 'Season'])['Review Rating'].mean().reset_index()
-
-    # Create the plot
-    fig = px.bar(state_season_avg_rating, x='Location', y='Review Rating', color='Season', barmode='group',
-                 title='Average Review Ratings by State and Season',
-                 labels={'Review Rating': 'Average Review Rating', 'Location': 'State'})
-
-    return fig
-
-# Callback to update the pie charts for each season
-@app.callback(
-    Output('season-item-pie-charts', 'figure'),
-    [Input('season-filter', 'value'),
-     Input('state-filter', 'value')]
-)
-def update_season_item_pie_charts(selected_seasons, selected_state):
-    # Filter the data based on the selected seasons
-    filtered_df = df[df['Season'].isin(selected_seasons)]
-
-    if selected_state:
-        filtered_df = filtered_df[filtered_df['state_abbr'] == selected_state]
-
-    # Grouping data for Question 2
-    q2_data = filtered_df.groupby(['Season', 'Item Purchased'])['Review Rating'].mean().reset_index()
-
-    # Create subplots for pie charts
-    fig = make_subplots(rows=2, cols=2, subplot_titles=("Average Review Ratings for Items in Winter",
-                                                        "Average Review Ratings for Items in Spring",
-                                                        "Average Review Ratings for Items in Summer",
-                                                        "Average Review Ratings for Items in Fall"),
-                        specs=[[{'type': 'pie'}, {'type': 'pie'}],
-                               [{'type': 'pie'}, {'type': 'pie'}]])
-
-    seasons = q2_data['Season'].unique()
-    for i, season in enumerate(seasons):
-        season_data = q2_data[q2_data['Season'] == season]
-        row, col = divmod(i, 2)
-        fig.add_trace(
-            go.Pie(labels=season_data['Item Purchased'], values=season_data['Review Rating'], name=season),
-            row=row+1, col=col+1
-        )
-
-    fig.update_layout(title_text='Average Review Ratings for Items in Each Season')
-
-    return fig
-
-# Callback to update the bubble plot
-@app.callback(
-    Output('bubble-plot', 'figure'),
-    [Input('season-filter', 'value'),
-     Input('state-filter', 'value')]
-)
-def update_bubble_plot(selected_seasons, selected_state):
-    # Filter the data based on the selected seasons
-    filtered_df = df[df['Season'].isin(selected_seasons)]
-
-    # If a state is selected, further filter the data
-    if selected_state:
-        filtered_df = filtered_df[filtered_df['state_abbr'] == selected_state]
-
-    # Aggregate data for the bubble plot
-    aggregated_data = filtered_df.groupby(['Item Purchased', 'Category']).agg({
-        'Review Rating': 'mean',
-        'Purchase Amount (USD)': 'mean',
-        'Previous Purchases': 'mean'  # Calculate the average instead of the sum
-    }).reset_index()
-
-    custom_palette = ["#EE82EE", "#87CEFA", "#3CB371", "#F4A460"]
-
-    # Create the bubble plot
-    fig = px.scatter(
-        data_frame=aggregated_data,
-        x='Review Rating',
-        y='Previous Purchases',
-        size='Purchase Amount (USD)',
-        color='Category',
-        hover_name='Item Purchased',
-        title=f'Aggregated Bubble Plot of Shopping Trends for {", ".join(selected_seasons)}',
-        labels={
-            'Purchase Amount (USD)': 'Purchase Amount (USD)',
-            'Review Rating': 'Review Rating',
-            'Previous Purchases': 'Previous Purchases',
-            'Category': 'Category'
-        },
-        color_discrete_sequence=custom_palette  # Apply the custom color palette
-    )
-
-    fig.update_traces(marker=dict(line=dict(width=2, color='DarkSlateGrey')))  # Add outline to bubbles
-
-    fig.update_layout(
-        height=600,
-        xaxis_title=dict(font=dict(size=18)),  # Enlarged axis title
-        yaxis_title=dict(font=dict(size=18)),  # Enlarged axis title
-        margin=dict(l=50, r=50, t=50, b=50),
-        font=dict(size=16)  # Enlarges numbers on the axis
-    )
-    return fig
-
-# Callback to update the bar chart for average review ratings by gender and age group
-@app.callback(
-    Output('gender-age-bar-chart', 'figure'),
-    [Input('season-filter', 'value'),
-     Input('gender-checklist', 'value')]
-)
-def update_gender_age_bar_chart(selected_seasons, selected_genders):
-    # Filter the data based on the selected seasons and genders
-    filtered_df = df[df['Season'].isin(selected_seasons)]
-    filtered_df = filtered_df[filtered_df['Gender'].isin(selected_genders)]
-
-    # Group data by Gender and Age Group
-    gender_age_avg_rating = filtered_df.groupby(['Gender', 'Age Group'])['Review Rating'].mean().reset_index()
-
-    # Create the plot
-    fig = px.bar(gender_age_avg_rating, x='Age Group', y='Review Rating', color='Gender', barmode='group',
-                 title='Average Review Ratings by Gender and Age Group',
-                 labels={'Review Rating': 'Average Review Rating', 'Age Group': 'Age Group'})
-
-    return fig
-
-if __name__ == '__main__':
+import functools
+import dash
+from dash import dcc, html, no_update
+from dash.dependencies import ClientsideFunction, Input, Output
+import instrumentation
+import settings
+from app_data import AGE_BIN_WIDTH, age_edges, data, item_rollup
+from callbacks import CallbackRegistry, callback_if, compression_enabled, lazy_import, triggered_inputs
+from clientside import age_gender_store, chart_store, template_store
+from dataset import state_abbrev
+from figure_cache import figure_cache
+from figure_templates import FigureTemplate
+from instrumentation import timed
+
+# Imported when the first figure is drawn
+px = lazy_import('plotly.express')
+go = lazy_import('plotly.graph_objects')
+subplots = lazy_import('plotly.subplots')
+
+# Callbacks declared below, registered on every app create_app() builds
+registry = CallbackRegistry()
+
+category_colors = {
+    'Clothing': '#FFEDA0',
+    'Footwear': '#FEB24C',
+    'Accessories': '#FC4E2A',
+    'Outerwear': '#BD0026'
+}
+
+color_package = "OrRd"
+
+font_dict = dict(family="Helvetica, sans-serif", size=18)
+
+# App layout, with the season options of the loaded data
+def build_layout(seasons):
+    return html.Div([
+        html.Div([
+            html.H1("Shopping Trends Dashboard", style={'textAlign': 'center', 'fontFamily': 'Helvetica', 'fontSize': '34px', 'padding': '20px 0'}),
+            html.P(
+                "Explore and analyze customer review ratings, purchase amounts, and trends across different states, seasons, and demographics. Use the filters to customize the visualizations and gain insights into shopping behaviors.",
+                style={'textAlign': 'center', 'fontFamily': 'Helvetica', 'fontSize': '20px', 'maxWidth': '800px', 'margin': '0 auto', 'padding': '10px 0'}
+            )
+        ], style={'backgroundColor': '#f9f9f9', 'padding': '20px', 'borderRadius': '10px', 'boxShadow': '0px 0px 15px rgba(0, 0, 0, 0.1)'}),
+        html.Div([
+            html.H2("Filter Options", style={'textAlign': 'left', 'fontFamily': 'Helvetica', 'fontSize': '28px', 'padding': '10px 0'}),
+            html.Div([
+                html.Div([
+                    html.Label("Seasons", style={'fontFamily': 'Helvetica', 'fontSize': '20px'}),
+                    dcc.Checklist(
+                        id='season-filter',
+                        options=[{'label': season, 'value': season} for season in seasons],
+                        value=seasons,  # Default to show all seasons
+                        inline=True,
+                        style={'fontFamily': 'Helvetica', 'fontSize': '18px'}
+                    ),
+                ], style={'flex': '1', 'padding': '10px'}),
+                html.Div([
+                    html.Label("State", style={'fontFamily': 'Helvetica', 'fontSize': '20px'}),
+                    dcc.Dropdown(
+                        id='state-filter',
+                        options=[{'label': state, 'value': abbrev} for state, abbrev in state_abbrev.items()],
+                        placeholder="Select a state",
+                        clearable=True,
+                        style={'fontFamily': 'Helvetica', 'fontSize': '18px'}
+                    ),
+                ], style={'flex': '1', 'padding': '10px'}),
+                html.Div([
+                    html.Label("Gender", style={'fontFamily': 'Helvetica', 'fontSize': '20px'}),
+                    dcc.Checklist(
+                        id='gender-checklist',
+                        options=[
+                            {'label': 'Male', 'value': 'Male'},
+                            {'label': 'Female', 'value': 'Female'}
+                        ],
+                        value=['Male', 'Female'],
+                        inline=True,
+                        style={'fontFamily': 'Helvetica', 'fontSize': '18px'}
+                    ),
+                ], style={'flex': '1', 'padding': '10px'}),
+            ], style={'display': 'flex', 'flexWrap': 'wrap', 'margin': '0 -10px'})
+        ], style={'backgroundColor': '#f9f9f9', 'padding': '20px', 'borderRadius': '10px', 'boxShadow': '0px 0px 15px rgba(0, 0, 0, 0.1)', 'margin': '20px 0'}),
+        html.Div([
+            html.H2("Visualizations", style={'textAlign': 'left', 'fontFamily': 'Helvetica', 'fontSize': '28px', 'padding': '10px 0'}),
+            html.Div([
+                html.P("This bar chart displays the average review ratings by state and season.",
+                       style={'fontFamily': 'Helvetica', 'fontSize': '18px'}),
+                dcc.Graph(id='state-season-bar-chart', style={'width': '100%', 'height': '500px', 'marginBottom': '40px'}),
+            ], style={'padding': '10px'}),
+            html.Div([
+                html.P("These pie charts show the average review ratings for items purchased in each season.",
+                       style={'fontFamily': 'Helvetica', 'fontSize': '18px'}),
+                dcc.Graph(id='season-item-pie-charts', style={'width': '100%', 'height': '1500px', 'marginBottom': '40px'}),  # Adjusted height
+            ], style={'padding': '10px'}),
+            html.Div([
+                html.P("This bubble plot aggregates shopping trends, showing review ratings, purchase amounts, and previous purchases for the selected seasons.",
+                       style={'fontFamily': 'Helvetica', 'fontSize': '18px'}),
+                dcc.Graph(id='bubble-plot', style={'width': '100%', 'height': '500px', 'marginBottom': '40px'}),
+            ], style={'padding': '10px'}),
+            html.Div([
+                html.P("This bar chart shows the average review ratings by gender and age group.",
+                       style={'fontFamily': 'Helvetica', 'fontSize': '18px'}),
+                html.Div([
+                    html.Label("Age group width (years)", style={'fontFamily': 'Helvetica', 'fontSize': '18px'}),
+                    dcc.Slider(
+                        id='age-bin-width',
+                        min=1, max=20, step=1, value=AGE_BIN_WIDTH,
+                        marks={width: str(width) for width in (1, 5, 10, 15, 20)},
+                        # A pre-rendered bundle only holds the default age groups
+                        disabled=bool(settings.PRERENDERED_BUNDLE)
+                    ),
+                    dcc.Input(
+                        id='age-bin-edges',
+                        type='text',
+                        debounce=True,
+                        placeholder="Custom age edges, e.g. 18, 25, 35, 50, 70",
+                        disabled=bool(settings.PRERENDERED_BUNDLE),
+                        style={'fontFamily': 'Helvetica', 'fontSize': '18px', 'width': '100%'}
+                    ),
+                ], style={'padding': '10px 0'}),
+                dcc.Graph(id='gender-age-bar-chart', style={'width': '100%', 'height': '500px', 'marginBottom': '80px'}),  # Added more space
+            ], style={'padding': '10px'})
+        ], style={'backgroundColor': '#f9f9f9', 'padding': '20px', 'borderRadius': '10px', 'boxShadow': '0px 0px 15px rgba(0, 0, 0, 0.1)', 'margin': '20px 0'})
+    ])
+
+# Draw the state-season bar chart
+def draw_state_season_bar_chart(state_season_avg_rating):
+    # Create the plot
+    fig = px.bar(state_season_avg_rating, x='Location', y='Review Rating', color='Season', barmode='group',
+                 title='Average Review Ratings by State and Season',
+                 labels={'Review Rating': 'Average Review Rating', 'Location': 'State'})
+
+    return fig
+
+state_season_bar_chart_template = FigureTemplate(draw_state_season_bar_chart, {'x': 'Location', 'y': 'Review Rating'},
+                                                 group='Season')
+
+# Build the state-season bar chart from the selected cells
+def build_state_season_bar_chart(cells):
+    # Group data by Location (State) and Season
+    state_season_avg_rating = cells.rollup(['Location', 'Season'], mean=['Review Rating'])
+    return state_season_bar_chart_template.figure(state_season_avg_rating)
+
+# The empty grid of pie charts, one per season, as a plain layout and the domain of each pie;
+# drawn once, as it does not depend on the data
+@functools.cache
+def pie_grid():
+    # Create subplots for pie charts
+    fig = subplots.make_subplots(rows=2, cols=2, subplot_titles=("Average Review Ratings for Items in Winter",
+                                                        "Average Review Ratings for Items in Spring",
+                                                        "Average Review Ratings for Items in Summer",
+                                                        "Average Review Ratings for Items in Fall"),
+                        specs=[[{'type': 'pie'}, {'type': 'pie'}],
+                               [{'type': 'pie'}, {'type': 'pie'}]])
+
+    fig.update_layout(title_text='Average Review Ratings for Items in Each Season')
+
+    domains = []
+    for i in range(4):
+        row, col = divmod(i, 2)
+        domain = fig.get_subplot(row+1, col+1)
+        domains.append({'x': list(domain.x), 'y': list(domain.y)})
+    return fig.to_plotly_json()['layout'], domains
+
+# Build the pie charts for each season from the selected cells
+def build_season_item_pie_charts(cells):
+    # Grouping data for Question 2
+    q2_data = cells.rollup(['Season', 'Item Purchased'], mean=['Review Rating'])
+
+    layout, domains = pie_grid()
+    traces = []
+    seasons = q2_data['Season'].unique()
+    for i, season in enumerate(seasons):
+        season_data = q2_data[q2_data['Season'] == season]
+        traces.append({'domain': domains[i], 'labels': season_data['Item Purchased'].to_numpy(),
+                       'name': season, 'type': 'pie', 'values': season_data['Review Rating'].to_numpy()})
+
+    return {'data': traces, 'layout': layout}
+
+custom_palette = ["#EE82EE", "#87CEFA", "#3CB371", "#F4A460"]
+
+# Draw the bubble plot of item aggregates
+def draw_bubble_plot(aggregated_data):
+    # Create the bubble plot
+    fig = px.scatter(
+        data_frame=aggregated_data,
+        x='Review Rating',
+        y='Previous Purchases',
+        size='Purchase Amount (USD)',
+        color='Category',
+        hover_name='Item Purchased',
+        title='Aggregated Bubble Plot of Shopping Trends',
+        labels={
+            'Purchase Amount (USD)': 'Purchase Amount (USD)',
+            'Review Rating': 'Review Rating',
+            'Previous Purchases': 'Previous Purchases',
+            'Category': 'Category'
+        },
+        color_discrete_sequence=custom_palette  # Apply the custom color palette
+    )
+
+    fig.update_traces(marker=dict(line=dict(width=2, color='DarkSlateGrey')))  # Add outline to bubbles
+
+    fig.update_layout(
+        height=600,
+        xaxis_title=dict(font=dict(size=18)),  # Enlarged axis title
+        yaxis_title=dict(font=dict(size=18)),  # Enlarged axis title
+        margin=dict(l=50, r=50, t=50, b=50),
+        font=dict(size=16)  # Enlarges numbers on the axis
+    )
+    return fig
+
+# Columns of the bubble plot's traces
+bubble_plot_arrays = {
+    'x': 'Review Rating',
+    'y': 'Previous Purchases',
+    'marker.size': 'Purchase Amount (USD)',
+    'hovertext': 'Item Purchased',
+}
+
+bubble_plot_template = FigureTemplate(draw_bubble_plot, bubble_plot_arrays, group='Category', colors=custom_palette)
+
+# Build the bubble plot from the selected cells
+def build_bubble_plot(cells, selected_seasons):
+    # Aggregate data for the bubble plot (averaging Previous Purchases instead of summing them)
+    aggregated_data = item_rollup(cells, previous_purchases='mean')
+    return bubble_plot_template.figure(
+        aggregated_data, {'title.text': f'Aggregated Bubble Plot of Shopping Trends for {", ".join(selected_seasons)}'}
+    )
+
+# Draw the bar chart for average review ratings by gender and age group
+def draw_gender_age_bar_chart(gender_age_avg_rating):
+    # Create the plot
+    fig = px.bar(gender_age_avg_rating, x='Age Group', y='Review Rating', color='Gender', barmode='group',
+                 title='Average Review Ratings by Gender and Age Group',
+                 labels={'Review Rating': 'Average Review Rating', 'Age Group': 'Age Group'})
+
+    return fig
+
+gender_age_bar_chart_template = FigureTemplate(draw_gender_age_bar_chart, {'x': 'Age Group', 'y': 'Review Rating'},
+                                               group='Gender')
+
+# Build the bar chart for average review ratings by gender and age group from the selected cells
+def build_gender_age_bar_chart(cells, edges):
+    # Group data by Gender and Age Group, re-binning the single-year ages into groups between the edges
+    gender_age_avg_rating = cells.age_histogram.rollup(['Gender', 'Age Group'], edges)
+    return gender_age_bar_chart_template.figure(gender_age_avg_rating)
+
+# Callback to update the state-season bar chart, unless it is drawn client-side
+@callback_if(
+    registry, not settings.COALESCE_CALLBACKS and not settings.CLIENTSIDE_FILTERING,
+    Output('state-season-bar-chart', 'figure'),
+    [Input('season-filter', 'value'),
+     Input('state-filter', 'value')],
+    layout_paths=[]
+)
+@figure_cache.memoize
+def update_state_season_bar_chart(selected_seasons, selected_state):
+    return build_state_season_bar_chart(data.cube.subset(seasons=selected_seasons, state=selected_state))
+
+# Callback to update the pie charts for each season, unless they are drawn client-side
+@callback_if(
+    registry, not settings.COALESCE_CALLBACKS and not settings.CLIENTSIDE_FILTERING,
+    Output('season-item-pie-charts', 'figure'),
+    [Input('season-filter', 'value'),
+     Input('state-filter', 'value')],
+    layout_paths=[]
+)
+@figure_cache.memoize
+def update_season_item_pie_charts(selected_seasons, selected_state):
+    return build_season_item_pie_charts(data.cube.subset(seasons=selected_seasons, state=selected_state))
+
+# Callback to update the bubble plot, unless it is drawn client-side
+@callback_if(
+    registry, not settings.COALESCE_CALLBACKS and not settings.CLIENTSIDE_FILTERING,
+    Output('bubble-plot', 'figure'),
+    [Input('season-filter', 'value'),
+     Input('state-filter', 'value')],
+    layout_paths=['title.text']
+)
+@figure_cache.memoize
+def update_bubble_plot(selected_seasons, selected_state):
+    return build_bubble_plot(data.cube.subset(seasons=selected_seasons, state=selected_state), selected_seasons)
+
+# Callback to update the bar chart for average review ratings by gender and age group, unless it is drawn client-side
+@callback_if(
+    registry, not settings.COALESCE_CALLBACKS and not settings.CLIENTSIDE_FILTERING,
+    Output('gender-age-bar-chart', 'figure'),
+    [Input('season-filter', 'value'),
+     Input('gender-checklist', 'value'),
+     Input('age-bin-width', 'value'),
+     Input('age-bin-edges', 'value')],
+    layout_paths=[]
+)
+@figure_cache.memoize
+def update_gender_age_bar_chart(selected_seasons, selected_genders, bin_width=AGE_BIN_WIDTH, custom_edges=None):
+    return build_gender_age_bar_chart(data.cube.subset(seasons=selected_seasons, genders=selected_genders),
+                                      age_edges(bin_width, custom_edges))
+
+# Coalesced callback updating every chart in one request
+@callback_if(
+    registry, settings.COALESCE_CALLBACKS and not settings.CLIENTSIDE_FILTERING,
+    [Output('state-season-bar-chart', 'figure'),
+     Output('season-item-pie-charts', 'figure'),
+     Output('bubble-plot', 'figure'),
+     Output('gender-age-bar-chart', 'figure')],
+    [Input('season-filter', 'value'),
+     Input('state-filter', 'value'),
+     Input('gender-checklist', 'value'),
+     Input('age-bin-width', 'value'),
+     Input('age-bin-edges', 'value')],
+    layout_paths=[[], [], ['title.text'], []]
+)
+def update_figures(selected_seasons, selected_state, selected_genders, bin_width, custom_edges):
+    # The gender checklist and the age groups only drive the gender/age chart, which ignores the state
+    triggered = triggered_inputs()
+    if triggered and triggered <= {'gender-checklist', 'age-bin-width', 'age-bin-edges'}:
+        return no_update, no_update, no_update, update_gender_age_bar_chart(selected_seasons, selected_genders,
+                                                                            bin_width, custom_edges)
+    figures = update_all_figures(selected_seasons, selected_state, selected_genders, bin_width, custom_edges)
+    if triggered == {'state-filter'}:
+        return figures[:3] + (no_update,)
+    return figures
+
+@figure_cache.memoize
+def update_all_figures(selected_seasons, selected_state, selected_genders, bin_width=AGE_BIN_WIDTH, custom_edges=None):
+    # Filter on season once, then narrow the shared cells by state or gender per chart
+    season_cells = data.cube.subset(seasons=selected_seasons)
+    cells = season_cells.subset(state=selected_state)
+    return (build_state_season_bar_chart(cells),
+            build_season_item_pie_charts(cells),
+            build_bubble_plot(cells, selected_seasons),
+            build_gender_age_bar_chart(season_cells.subset(genders=selected_genders), age_edges(bin_width, custom_edges)))
+
+# Draw the gender/age chart in the browser from cells shipped once with the layout; cached until
+# the data is refreshed
+@figure_cache.memoize
+def client_cells():
+    cells = data.cube
+    return age_gender_store(cells, build_gender_age_bar_chart(cells, age_edges()))
+
+# Draw the state-season bar chart, the pie charts and the bubble plot in the browser from sums and
+# counts per season, state and item shipped once with the layout, in the styling of the server's
+# figures; cached until the data is refreshed
+@figure_cache.memoize
+def chart_cells():
+    cells, seasons = data.cube, season_options()
+    empty = cells.subset(seasons=[])
+    # Drawn once, so the templates have learnt their styling
+    build_state_season_bar_chart(cells), build_bubble_plot(cells, seasons)
+    layout, domains = pie_grid()
+    return chart_store(cells, {
+        'state_season_bar': template_store(state_season_bar_chart_template, build_state_season_bar_chart(empty)),
+        'pie': {'layout': layout, 'domains': domains},
+        'bubble': dict(template_store(bubble_plot_template, build_bubble_plot(empty, [])),
+                       arrays=bubble_plot_arrays, total=[]),
+    })
+
+if settings.CLIENTSIDE_FILTERING:
+    for function_name, chart in (('state_season_bar_chart', 'state-season-bar-chart'),
+                                 ('season_item_pie_charts', 'season-item-pie-charts'), ('bubble_plot', 'bubble-plot')):
+        registry.clientside_callback(
+            ClientsideFunction(namespace='shopping', function_name=function_name),
+            Output(chart, 'figure'),
+            [Input('chart-cells', 'data'),
+             Input('season-filter', 'value'),
+             Input('state-filter', 'value')]
+        )
+    registry.clientside_callback(
+        ClientsideFunction(namespace='shopping', function_name='gender_age_bar_chart'),
+        Output('gender-age-bar-chart', 'figure'),
+        [Input('age-gender-cells', 'data'),
+         Input('season-filter', 'value'),
+         Input('gender-checklist', 'value'),
+         Input('age-bin-width', 'value'),
+         Input('age-bin-edges', 'value')]
+    )
+
+# Season options of the current data; cached until the data is refreshed
+@figure_cache.memoize
+def season_options():
+    return data.cube.seasons()
+
+# Layout of a page load, from the current data
+def serve_layout():
+    layout = build_layout(season_options())
+    if settings.CLIENTSIDE_FILTERING:
+        layout.children.append(dcc.Store(id='age-gender-cells', data=client_cells()))
+        layout.children.append(dcc.Store(id='chart-cells', data=chart_cells()))
+    return layout
+
+# Build a Dash app serving this dashboard, on its own Flask server or under url_base_pathname
+# of a shared one; no data is read until the first page or callback
+def create_app(server=True, url_base_pathname=None):
+    with timed('create app'):
+        app = dash.Dash(__name__, server=server, url_base_pathname=url_base_pathname,
+                        compress=compression_enabled())
+        instrumentation.install(app)
+        # Dash checks callbacks against this data-free layout instead of calling serve_layout
+        app.validation_layout = html.Div([build_layout([]), dcc.Store(id='age-gender-cells'), dcc.Store(id='chart-cells')])
+        app.layout = serve_layout
+        registry.register(app)
+    return app
+
+# Load the data, import the plotting libraries and build the layout ahead of the first request,
+# returning the seconds spent per startup step
+def warm_up():
+    # A pre-rendered bundle answers every callback, so the data is not read at all
+    if not settings.PRERENDERED_BUNDLE:
+        data.load()
+    with timed('import plotting'):
+        px.bar, go.Pie, subplots.make_subplots
+    with timed('build layout'):
+        serve_layout()
+    # Draw each chart once, so the first request only fills in its template
+    if not settings.PRERENDERED_BUNDLE:
+        with timed('draw figure templates'):
+            cells, seasons = data.cube, season_options()
+            build_state_season_bar_chart(cells), build_season_item_pie_charts(cells), build_bubble_plot(cells, seasons)
+            build_gender_age_bar_chart(cells, age_edges())
+    return dict(instrumentation.startup_seconds)
+
+app = create_app()
+
+# WSGI entry point for production servers, e.g. serve.py or `gunicorn bad_visualization:server`
+server = app.server
+
+if __name__ == '__main__':
     app.run_server(debug=True, port=8050)
\ No newline at end of file
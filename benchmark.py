@@ -0,0 +1,181 @@
+import argparse
+import importlib
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from instrumentation import timed
+from synthetic_data import SEASONS, write_csv
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Inputs of every callback, in argument order
+CALLBACKS = {
+    'good_visualization': {
+        'update_map': ('seasons', 'state'),
+        'update_bar_chart': ('seasons', 'state'),
+        'update_bubble_plot': ('seasons', 'state'),
+        'update_scatter_plot': ('overall_genders', 'seasons', 'state', 'bin_width', 'age_edges'),
+    },
+    'bad_visualization': {
+        'update_state_season_bar_chart': ('seasons', 'state'),
+        'update_season_item_pie_charts': ('seasons', 'state'),
+        'update_bubble_plot': ('seasons', 'state'),
+        'update_gender_age_bar_chart': ('seasons', 'genders', 'bin_width', 'age_edges'),
+    },
+}
+
+# Filter combinations each callback is called with
+FILTERS = {
+    'seasons': [list(subset) for size in range(len(SEASONS), -1, -1) for subset in itertools.combinations(SEASONS, size)],
+    'state': [None, 'CA', 'WY'],
+    'genders': [['Male', 'Female'], ['Male'], ['Female']],
+    'overall_genders': [['Male', 'Female', 'Overall'], ['Overall'], ['Male', 'Female']],
+    'bin_width': [5, 1],
+    'age_edges': [None],
+}
+
+
+def summarise(latencies):
+    latencies = np.array(latencies) * 1000
+    return {
+        'calls': len(latencies),
+        'mean_ms': float(latencies.mean()),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'max_ms': float(latencies.max()),
+    }
+
+
+def run_app(app_name, repeat, memory_samples):
+    # Runs inside a fresh process whose working directory holds the generated CSV
+    started = time.perf_counter()
+    with timed('import app'):
+        module = importlib.import_module(app_name)
+    startup = module.warm_up()
+    load_s = time.perf_counter() - started
+    load_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    results = []
+    for name, inputs in CALLBACKS[app_name].items():
+        callback = getattr(module, name)
+        combinations = list(itertools.product(*(FILTERS[kind] for kind in inputs)))
+
+        # Time every combination, then measure peak allocations in a separate pass over the
+        # first (widest) combinations, since tracing slows every allocation down
+        latencies = []
+        for _ in range(repeat):
+            for args in combinations:
+                started = time.perf_counter()
+                callback(*args)
+                latencies.append(time.perf_counter() - started)
+
+        tracemalloc.start()
+        peak = 0
+        for args in combinations[:memory_samples]:
+            tracemalloc.reset_peak()
+            callback(*args)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+        results.append(dict(callback=name, peak_kb=peak / 1024, **summarise(latencies)))
+    return {'load_s': load_s, 'load_rss_mb': load_rss_mb, 'startup_s': startup, 'callbacks': results}
+
+
+def dataset_for(rows, data_dir, seed):
+    # Generated CSVs are reused between runs with the same size and seed
+    directory = os.path.join(data_dir, f'{rows}-{seed}')
+    path = os.path.join(directory, 'shopping_trends_updated.csv')
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        write_csv(path + '.tmp', rows, seed)
+        os.replace(path + '.tmp', path)
+    return directory
+
+
+def run(sizes, apps, repeat, memory_samples, data_dir, seed):
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'repeat': repeat,
+            'memory_samples': memory_samples,
+            'seed': seed,
+        },
+        'results': [],
+    }
+    for rows in sizes:
+        directory = dataset_for(rows, data_dir, seed)
+        for app_name in apps:
+            # Each app and size runs in its own process, so load time and peak memory are not shared
+            env = dict(os.environ, FIGURE_CACHE_SIZE='0', REFRESH_INTERVAL='0',
+                       PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get('PYTHONPATH')])))
+            output = subprocess.run(
+                [sys.executable, os.path.join(REPO_DIR, 'benchmark.py'), '--worker', app_name,
+                 '--repeat', str(repeat), '--memory-samples', str(memory_samples)],
+                cwd=directory, env=env, check=True, capture_output=True, text=True
+            ).stdout
+            measured = json.loads(output.splitlines()[-1])
+            for result in measured.pop('callbacks'):
+                report['results'].append(dict(app=app_name, rows=rows, **measured, **result))
+            print(f'{app_name} at {rows} rows: loaded in {measured["load_s"]:.2f}s', file=sys.stderr)
+    return report
+
+
+def compare(baseline, current, threshold):
+    # Print the change in p95 latency per callback and size, flagging regressions past the threshold
+    key = lambda result: (result['app'], result['rows'], result['callback'])
+    previous = {key(result): result for result in baseline['results']}
+    regressions = 0
+    for result in current['results']:
+        before = previous.get(key(result))
+        if before is None:
+            continue
+        ratio = result['p95_ms'] / before['p95_ms'] if before['p95_ms'] else float('inf')
+        flag = 'REGRESSION' if ratio > 1 + threshold else ''
+        regressions += bool(flag)
+        print(f'{result["app"]:20} {result["rows"]:>10} {result["callback"]:32} '
+              f'p95 {before["p95_ms"]:9.2f} -> {result["p95_ms"]:9.2f} ms  x{ratio:5.2f} {flag}', file=sys.stderr)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the dashboard callbacks on synthetic data.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[3900, 100_000, 1_000_000])
+    parser.add_argument('--apps', nargs='+', choices=list(CALLBACKS), default=list(CALLBACKS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--memory-samples', type=int, default=3, help='filter combinations traced for peak memory')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'shopping_trends_bench'))
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--compare', help='JSON report of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed p95 slowdown before flagging')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_app(args.worker, args.repeat, args.memory_samples)))
+        sys.exit(0)
+
+    report = run(args.sizes, args.apps, args.repeat, args.memory_samples, args.data_dir, args.seed)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as file:
+            sys.exit(1 if compare(json.load(file), report, args.threshold) else 0)
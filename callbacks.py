@@ -0,0 +1,117 @@
+import functools
+import importlib.util
+import sys
+
+import dash
+import plotly.io
+
+import settings
+from instrumentation import instrument
+
+# Encode responses with orjson, which serialises numpy arrays directly, when it is installed
+if importlib.util.find_spec('orjson'):
+    plotly.io.json.config.default_engine = 'orjson'
+
+
+def lazy_import(name):
+    # A module that is only imported once one of its attributes is used, e.g. plotly.express,
+    # which adds noticeably to startup but is only needed to draw the first figure
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class CallbackRegistry:
+    # Stands in for the app in callback_if while a dashboard module is imported, and registers
+    # the declared callbacks on every app its factory creates
+
+    def __init__(self):
+        self.callbacks = []
+        self.clientside_callbacks = []
+
+    def callback(self, *args, **kwargs):
+        def declare(func):
+            self.callbacks.append((func, args, kwargs))
+            return func
+
+        return declare
+
+    def clientside_callback(self, *args, **kwargs):
+        self.clientside_callbacks.append((args, kwargs))
+
+    def register(self, app):
+        for func, args, kwargs in self.callbacks:
+            app.callback(*args, **kwargs)(func)
+        for args, kwargs in self.clientside_callbacks:
+            app.clientside_callback(*args, **kwargs)
+
+
+def compression_enabled():
+    # Dash compresses responses through the optional flask-compress package
+    return settings.COMPRESS_RESPONSES and importlib.util.find_spec('flask_compress') is not None
+
+
+def callback_if(app, enabled, *args, layout_paths=None, **kwargs):
+    # Register a Dash callback only in the serving mode that uses it. layout_paths lists, per
+    # figure output (None for other outputs), the layout properties that change with the inputs,
+    # so later updates can be sent as partial patches; the callback is instrumented when enabled.
+    def register(func):
+        if enabled:
+            callback = func
+            if settings.PARTIAL_UPDATES and layout_paths is not None:
+                callback = partial_updates(callback, layout_paths)
+            if settings.INSTRUMENT_CALLBACKS:
+                callback = instrument(callback)
+            app.callback(*args, **kwargs)(callback)
+        return func
+
+    return register
+
+
+def triggered_inputs():
+    # Ids of the inputs that fired this callback; empty on the initial page load
+    return {trigger['prop_id'].split('.')[0] for trigger in dash.callback_context.triggered} - {''}
+
+
+def patch_figure(figure, layout_paths):
+    # A partial update replacing the traces and the given dotted layout paths, leaving the rest
+    # of the layout (template, geo configuration, colour scales) as the browser already has it
+    if figure is dash.no_update:
+        return figure
+    figure = figure if isinstance(figure, dict) else figure.to_plotly_json()
+    patch = dash.Patch()
+    patch['data'] = figure['data']
+    for path in layout_paths:
+        *parents, key = path.split('.')
+        source = figure['layout']
+        target = patch['layout']
+        for parent in parents:
+            source = source.get(parent, {})
+            target = target[parent]
+        if key in source:
+            target[key] = source[key]
+        else:
+            del target[key]
+    return patch
+
+
+def partial_updates(func, layout_paths):
+    # Send full figures on the initial render and patches afterwards
+    multiple = bool(layout_paths) and isinstance(layout_paths[0], (list, tuple))
+
+    @functools.wraps(func)
+    def wrapper(*args):
+        result = func(*args)
+        if not triggered_inputs():
+            return result
+        if multiple:
+            return tuple(figure if paths is None else patch_figure(figure, paths)
+                         for figure, paths in zip(result, layout_paths))
+        return patch_figure(result, layout_paths)
+
+    return wrapper
@@ -0,0 +1,59 @@
+from app_data import AGE_BIN_WIDTH, MAX_AGE
+from cube import AGE_MEASURE, MEASURES, count_column, rollup_columns
+from dataset import bins
+
+
+def age_gender_store(cube, reference):
+    # Review rating sums and counts per season x state x gender x single year of age, plus the
+    # layout and trace styling of a server-rendered reference figure, for charts drawn (and
+    # re-binned) in the browser. The reference may be a figure or its plain dict.
+    cells = cube.age_histogram.cells()
+    figure = reference if isinstance(reference, dict) else reference.to_plotly_json()
+    traces = {}
+    for trace in figure['data']:
+        traces[trace['name']] = {key: value for key, value in trace.items() if key not in ('x', 'y')}
+
+    return {
+        'season': cells['Season'].tolist(),
+        'state': cells['state_abbr'].tolist(),
+        'age': [int(age) for age in cells['Age']],
+        'gender': cells['Gender'].tolist(),
+        'sum': cells[AGE_MEASURE].tolist(),
+        'count': cells[count_column(AGE_MEASURE)].tolist(),
+        # Range and width of the default age groups, as in app_data.age_edges
+        'ageStart': bins[0],
+        'ageStop': bins[-1],
+        'binWidth': AGE_BIN_WIDTH,
+        'maxAge': MAX_AGE,
+        'traces': traces,
+        'layout': figure['layout'],
+    }
+
+
+# Groups of the cells shipped for the season- and state-filtered charts
+CHART_GROUPS = ['Season', 'state_abbr', 'Location', 'Item Purchased', 'Category']
+
+
+def template_store(template, empty):
+    # The layout, prototype trace and colours of a drawn FigureTemplate, and the server's figure
+    # of no rows, for refilling the chart in the browser as FigureTemplate.figure does
+    layout, trace, colors = template.skeleton
+    empty = empty if isinstance(empty, dict) else empty.to_plotly_json()
+    return {'layout': layout, 'trace': trace, 'colors': colors, 'empty': {'data': empty['data'], 'layout': empty['layout']}}
+
+
+def chart_store(cube, charts):
+    # Sums and non-null counts of every measure per season x state x location x item x category,
+    # for the map, bar, pie and bubble charts drawn in the browser, plus each chart's styling.
+    # Group values are codes into labels in category order, so sorting by codes orders groups
+    # like the server's roll-ups; -1 marks a missing value, left out only by charts grouping by it.
+    table = cube.rollup(CHART_GROUPS, total=rollup_columns(mean=MEASURES), dropna=False)
+    groups = {}
+    for column in CHART_GROUPS:
+        values = table[column].astype('category')
+        groups[column] = {'labels': values.cat.categories.tolist(), 'codes': values.cat.codes.tolist()}
+    return {
+        'groups': groups,
+        'sums': {column: table[column].tolist() for column in rollup_columns(mean=MEASURES)},
+        'charts': charts,
+    }
@@ -0,0 +1,299 @@
+import functools
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from figure_cache import canonical
+from instrumentation import phase, record_rows
+from shared_cache import shared_cache
+
+# Dimensions every chart groups by, and the measures the charts average or total
+DIMENSIONS = ['Season', 'Location', 'state_abbr', 'Item Purchased', 'Category', 'Age Group', 'Gender']
+MEASURES = ['Review Rating', 'Purchase Amount (USD)', 'Previous Purchases']
+
+# Columns the dashboards filter on
+FILTER_COLUMNS = ['Season', 'state_abbr', 'Gender']
+
+# Axes of the single-year age histogram, and the measure it sums
+AGE_AXES = ['Season', 'state_abbr', 'Gender', 'Age']
+AGE_MEASURE = 'Review Rating'
+
+# Label of rows with no value on an axis of the age histogram, e.g. a location without a state
+# abbreviation; no filter selects it, but unfiltered roll-ups still count those rows
+MISSING = '(missing)'
+
+
+def count_column(measure):
+    return f'{measure} count'
+
+
+def group_cells(frame):
+    # Rows grouped per combination of dimension values, in order of first appearance
+    return frame.groupby(DIMENSIONS, observed=True, dropna=False, sort=False)
+
+
+def aggregate(frame, grouped=None):
+    # Collapse raw transactions into one row per combination of dimension values,
+    # keeping the sum and the non-null count of every measure
+    grouped = group_cells(frame) if grouped is None else grouped
+    sums = grouped[MEASURES].sum()
+    counts = grouped[MEASURES].count().rename(columns=count_column)
+    return pd.concat([sums, counts], axis=1).reset_index()
+
+
+def merge(tables):
+    # Add up the cells of several cube tables, e.g. partial aggregates of separate chunks
+    table = pd.concat(tables, ignore_index=True)
+    table = group_cells(table).sum().reset_index()
+
+    # Chunks with different category sets come back as plain strings
+    for column in DIMENSIONS:
+        if not isinstance(table[column].dtype, pd.CategoricalDtype):
+            table[column] = table[column].astype('category')
+    return table
+
+
+def partition_cells(frame, positions):
+    # The cells and age cells of a partition of the rows that holds every row of its cells, e.g. all
+    # the rows of some states, with the position of each cell's first row in the whole frame
+    grouped = group_cells(frame)
+    table = aggregate(frame, grouped)
+    table['first row'] = positions[grouped.head(1).index]
+    return table, age_cells(frame)
+
+
+def gather(parts):
+    # One cube from the cells of disjoint partitions, in the row order of aggregating all rows at
+    # once. A cell's sums add up the same rows in the same order either way, so the cube is
+    # identical to Cube.from_frame of the whole frame.
+    tables, ages = zip(*parts)
+    table = pd.concat(tables, ignore_index=True).sort_values('first row').drop(columns='first row')
+    return Cube(table.reset_index(drop=True), ages=AgeHistogram.from_cells(pd.concat(ages, ignore_index=True)))
+
+
+def combine(cubes):
+    # One cube adding up the cells and age histograms of several
+    return Cube(merge([cube.table for cube in cubes]), ages=AgeHistogram.merge([cube.ages for cube in cubes]))
+
+
+def age_cells(frame):
+    # Review rating sums and counts of raw rows per combination of AGE_AXES values
+    grouped = frame.groupby(AGE_AXES, observed=True, dropna=False, sort=False)[AGE_MEASURE]
+    return pd.concat([grouped.sum(), grouped.count().rename(count_column(AGE_MEASURE))], axis=1).reset_index()
+
+
+def age_labels(edges):
+    # 'low-high' labels of the age groups from each edge up to, not including, the next
+    return [f'{low}-{high - 1}' if high - low > 1 else f'{low}' for low, high in zip(edges, edges[1:])]
+
+
+def rollup_columns(mean=(), total=()):
+    # Summed columns a roll-up needs: each averaged measure and its count, and each total
+    return list(dict.fromkeys(list(mean) + [count_column(measure) for measure in mean] + list(total)))
+
+
+def finish_rollup(sums, mean=(), total=()):
+    # Means and totals from the summed columns per group; a mean is the summed measure over its summed count
+    result = pd.DataFrame(index=sums.index)
+    for measure in mean:
+        result[measure] = sums[measure] / sums[count_column(measure)]
+    for measure in total:
+        result[measure] = sums[measure]
+    return result.reset_index()
+
+
+def build_index(table, columns=FILTER_COLUMNS):
+    # Row positions holding each value of every filter column
+    return {column: table.groupby(column, observed=True, sort=False).indices for column in columns}
+
+
+class Cube:
+    # Pre-aggregated sums and counts, built once at load time. Every chart is a
+    # roll-up of these cells, so callback cost depends on the number of
+    # dimension combinations rather than the number of transactions.
+
+    def __init__(self, table, origin=None, ages=None):
+        self.table = table
+        # The cube and filters a subset was cut from
+        self.origin = origin
+        # Single-year age histogram of the same rows, kept by the root cube
+        self.ages = ages
+
+    @functools.cached_property
+    def index(self):
+        return build_index(self.table)
+
+    @functools.cached_property
+    def version(self):
+        # Content hash of the cells, identifying this dataset in shared caches. A subset is
+        # named after the cube it was cut from and its filters, so it is not hashed again.
+        if self.origin is not None:
+            parent, filters = self.origin
+            return hashlib.sha256(repr((parent.version,) + filters).encode()).hexdigest()
+        digest = hashlib.sha256(repr(list(self.table.columns)).encode())
+        digest.update(pd.util.hash_pandas_object(self.table, index=False).to_numpy().tobytes())
+        return digest.hexdigest()
+
+    @functools.cached_property
+    def age_histogram(self):
+        # A subset's histogram is its parent's, filtered the same way
+        if self.origin is not None:
+            parent, filters = self.origin
+            return parent.age_histogram.subset(*filters)
+        return self.ages
+
+    @classmethod
+    def from_frame(cls, frame):
+        return cls(aggregate(frame), ages=AgeHistogram.from_frame(frame))
+
+    def warm(self):
+        # Build the lazily computed parts up front, e.g. before forking workers
+        self.index
+
+    def seasons(self):
+        return list(self.table['Season'].unique())
+
+    def lookup(self, column, values):
+        # Positions of the rows whose column holds any of the values
+        positions = self.index[column]
+        matched = [positions[value] for value in values if value in positions]
+        if not matched:
+            return np.empty(0, dtype=np.intp)
+        return np.sort(np.concatenate(matched))
+
+    def select(self, seasons=None, state=None, genders=None):
+        # Intersect the precomputed positions of each active filter instead of scanning the table;
+        # None means no filter is active and every row is selected
+        with phase('filter'):
+            return self.intersect(seasons, state, genders)
+
+    def intersect(self, seasons, state, genders):
+        selections = []
+        if seasons is not None:
+            selections.append(self.lookup('Season', seasons))
+        if state:
+            selections.append(self.lookup('state_abbr', [state]))
+        if genders is not None:
+            selections.append(self.lookup('Gender', genders))
+
+        if not selections:
+            return None
+        positions = selections[0]
+        for selection in selections[1:]:
+            positions = np.intersect1d(positions, selection, assume_unique=True)
+        return positions
+
+    def subset(self, seasons=None, state=None, genders=None):
+        # A smaller cube of the selected cells, so several charts can share one filter pass
+        positions = self.select(seasons, state, genders)
+        if positions is None:
+            return self
+        with phase('filter'):
+            return Cube(self.table.take(positions).reset_index(drop=True),
+                        origin=(self, (canonical(seasons), state or None, canonical(genders))))
+
+    @shared_cache.memoize
+    def rollup(self, by, seasons=None, state=None, genders=None, mean=(), total=(), dropna=True):
+        # Read only the matching cells and the columns this roll-up needs; cells missing a group
+        # value are left out unless dropna is False
+        columns = rollup_columns(mean, total)
+        cells = self.table[list(by) + columns]
+        positions = self.select(seasons, state, genders)
+        if positions is not None:
+            with phase('filter'):
+                cells = cells.take(positions)
+        record_rows(len(cells))
+
+        # Add up the cells per group
+        with phase('aggregate'):
+            return finish_rollup(cells.groupby(by, observed=True, dropna=dropna)[columns].sum(), mean, total)
+
+
+class AgeHistogram:
+    # Review rating sums and counts in dense arrays over season x state x gender x single year of
+    # age. Age groups of any width are sums of adjacent cells, so re-binning costs a pass over the
+    # ages instead of a pass over the rows.
+
+    def __init__(self, axes, sums, counts):
+        # Labels along each of AGE_AXES; the ages run over every year from the youngest to the oldest
+        self.axes = axes
+        self.sums = sums
+        self.counts = counts
+
+    @classmethod
+    def from_cells(cls, table):
+        # From rows of AGE_AXES values with the measure's sum and count; repeated rows add up
+        table = table.dropna(subset=['Age'])
+        ages = table['Age'].to_numpy().astype(int)
+        labels = {axis: table[axis].astype(object).fillna(MISSING).astype(str) for axis in AGE_AXES[:-1]}
+        axes = {axis: sorted(labels[axis].unique()) for axis in AGE_AXES[:-1]}
+        axes['Age'] = list(range(ages.min(), ages.max() + 1)) if len(ages) else []
+
+        positions = tuple(pd.Index(axes[axis]).get_indexer(labels[axis]) for axis in AGE_AXES[:-1])
+        positions += (ages - ages.min() if len(ages) else ages,)
+        shape = tuple(len(axes[axis]) for axis in AGE_AXES)
+        sums, counts = np.zeros(shape), np.zeros(shape)
+        np.add.at(sums, positions, table[AGE_MEASURE].to_numpy(dtype=float))
+        np.add.at(counts, positions, table[count_column(AGE_MEASURE)].to_numpy(dtype=float))
+        return cls(axes, sums, counts)
+
+    @classmethod
+    def from_frame(cls, frame):
+        return cls.from_cells(age_cells(frame))
+
+    @classmethod
+    def merge(cls, histograms):
+        return cls.from_cells(pd.concat([histogram.cells() for histogram in histograms], ignore_index=True))
+
+    def cells(self):
+        # The rated cells as rows, the inverse of from_cells
+        positions = np.nonzero(self.counts)
+        table = pd.DataFrame({axis: np.asarray(self.axes[axis], dtype=object)[position]
+                              for axis, position in zip(AGE_AXES, positions)})
+        table[AGE_MEASURE] = self.sums[positions]
+        table[count_column(AGE_MEASURE)] = self.counts[positions]
+        return table
+
+    def subset(self, seasons=None, state=None, genders=None):
+        sums, counts, axes = self.sums, self.counts, dict(self.axes)
+        for position, (axis, values) in enumerate((('Season', seasons), ('state_abbr', [state] if state else None),
+                                                   ('Gender', genders))):
+            if values is None:
+                continue
+            kept = [index for index, label in enumerate(axes[axis]) if label in values]
+            sums, counts = sums.take(kept, axis=position), counts.take(kept, axis=position)
+            axes[axis] = [axes[axis][index] for index in kept]
+        return AgeHistogram(axes, sums, counts)
+
+    def rollup(self, by, edges):
+        # Average rating per age group between consecutive edges, and per gender when 'Gender' is in
+        # by, in the row order of Cube.rollup. Each group adds up the ages from its edge to the
+        # next with reduceat over a trailing zero, which stands in for groups outside the ages.
+        sums, counts = (np.pad(values.sum(axis=(0, 1)), [(0, 0), (0, 1)]) for values in (self.sums, self.counts))
+        ages = self.axes['Age']
+        positions = np.clip(np.asarray(edges) - (ages[0] if ages else 0), 0, len(ages))
+        empty = np.diff(positions) == 0
+        sums, counts = (np.where(empty, 0, np.add.reduceat(values, positions, axis=1)[:, :-1])
+                        for values in (sums, counts))
+        genders = self.axes['Gender']
+        if 'Gender' in by:
+            # Rows without a gender only count towards the overall averages
+            known = [index for index, gender in enumerate(genders) if gender != MISSING]
+            sums, counts, genders = sums[known], counts[known], [genders[index] for index in known]
+        else:
+            sums, counts, genders = sums.sum(axis=0, keepdims=True), counts.sum(axis=0, keepdims=True), [None]
+
+        groups, gender = np.meshgrid(np.arange(len(edges) - 1), np.arange(len(genders)))
+        if by[0] != 'Gender':
+            groups, gender = groups.T, gender.T
+        groups, gender = groups.ravel(), gender.ravel()
+        rated = counts[gender, groups] > 0
+        groups, gender = groups[rated], gender[rated]
+
+        labels = age_labels(edges)
+        result = pd.DataFrame({'Age Group': pd.Categorical.from_codes(groups, categories=labels, ordered=True)})
+        if 'Gender' in by:
+            result['Gender'] = pd.Categorical.from_codes(gender, categories=genders)
+        result[AGE_MEASURE] = sums[gender, groups] / counts[gender, groups]
+        return result[list(by) + [AGE_MEASURE]]
@@ -0,0 +1,35 @@
+import flask
+
+import bad_visualization
+import good_visualization
+import instrumentation
+from app_data import data
+
+# Both dashboards under one Flask server, each a Dash app with its own URL prefix, so their
+# component ids stay apart while they read the same loaded dataset and figure cache
+DASHBOARDS = {
+    'good': ('Shopping Trends Dashboard', good_visualization),
+    'bad': ('Shopping Trends Dashboard (original design)', bad_visualization),
+}
+
+server = flask.Flask(__name__)
+apps = {path: module.create_app(server=server, url_base_pathname=f'/{path}/')
+        for path, (title, module) in DASHBOARDS.items()}
+
+
+# Landing page linking every dashboard
+@server.route('/')
+def index():
+    links = ''.join(f'<li><a href="/{path}/">{title}</a></li>' for path, (title, module) in DASHBOARDS.items())
+    return f'<!DOCTYPE html><title>Shopping Trends</title><ul style="font-family: Helvetica">{links}</ul>'
+
+
+# Load the data once and warm up every dashboard, returning the seconds spent per startup step
+def warm_up():
+    for title, module in DASHBOARDS.values():
+        module.warm_up()
+    return dict(instrumentation.startup_seconds)
+
+
+if __name__ == '__main__':
+    server.run(debug=True, port=8050)
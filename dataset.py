@@ -0,0 +1,240 @@
+import io
+import itertools
+import multiprocessing
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from cube import DIMENSIONS, MEASURES, Cube, combine, gather, partition_cells
+from settings import AGGREGATE_WORKERS, QUERY_BACKEND, QUERY_SOURCE, STREAM_CHUNKSIZE
+
+# Raw transactions and the columnar cache written from them
+CSV_PATH = 'shopping_trends_updated.csv'
+CACHE_PATH = 'shopping_trends_updated.parquet'
+
+# Mapping full state names to their abbreviations
+state_abbrev = {
+    'Alabama': 'AL', 'Alaska': 'AK', 'Arizona': 'AZ', 'Arkansas': 'AR',
+    'California': 'CA', 'Colorado': 'CO', 'Connecticut': 'CT', 'Delaware': 'DE',
+    'Florida': 'FL', 'Georgia': 'GA', 'Hawaii': 'HI', 'Idaho': 'ID',
+    'Illinois': 'IL', 'Indiana': 'IN', 'Iowa': 'IA', 'Kansas': 'KS',
+    'Kentucky': 'KY', 'Louisiana': 'LA', 'Maine': 'ME', 'Maryland': 'MD',
+    'Massachusetts': 'MA', 'Michigan': 'MI', 'Minnesota': 'MN', 'Mississippi': 'MS',
+    'Missouri': 'MO', 'Montana': 'MT', 'Nebraska': 'NE', 'Nevada': 'NV',
+    'New Hampshire': 'NH', 'New Jersey': 'NJ', 'New Mexico': 'NM', 'New York': 'NY',
+    'North Carolina': 'NC', 'North Dakota': 'ND', 'Ohio': 'OH', 'Oklahoma': 'OK',
+    'Oregon': 'OR', 'Pennsylvania': 'PA', 'Rhode Island': 'RI', 'South Carolina': 'SC',
+    'South Dakota': 'SD', 'Tennessee': 'TN', 'Texas': 'TX', 'Utah': 'UT',
+    'Vermont': 'VT', 'Virginia': 'VA', 'Washington': 'WA', 'West Virginia': 'WV',
+    'Wisconsin': 'WI', 'Wyoming': 'WY'
+}
+
+# Bin the ages into 5-year intervals with a range from 15 to 70
+bins = list(range(15, 76, 5))
+labels = [f'{i}-{i+4}' for i in range(15, 71, 5)]
+
+# String columns stored as integer-coded categoricals
+CATEGORICAL_COLUMNS = ['Location', 'Season', 'Item Purchased', 'Category', 'Gender', 'state_abbr']
+
+
+def prepare(frame):
+    # Add a 'state_abbr' column and the 'Age Group' bins to raw rows
+    frame['state_abbr'] = frame['Location'].map(state_abbrev)
+    frame['Age Group'] = pd.cut(frame['Age'], bins=bins, labels=labels, right=False)
+
+    # Replace object strings with compact categorical codes, including the remaining text columns
+    text_columns = [column for column in frame.columns if pd.api.types.is_string_dtype(frame[column])]
+    for column in dict.fromkeys(CATEGORICAL_COLUMNS + text_columns):
+        frame[column] = frame[column].astype('category')
+    return frame
+
+
+class FilePrefix(io.RawIOBase):
+    # The first size bytes of a file, read as they are needed, so a load can stop where the file
+    # ended when it started while rows are still being appended
+
+    def __init__(self, path, size):
+        self.file = open(path, 'rb')
+        self.remaining = size
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.file.read(min(len(buffer), self.remaining))
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+def open_prefix(path, size):
+    return io.BufferedReader(FilePrefix(path, size))
+
+
+def complete_size(csv_path, block=1 << 16):
+    # Bytes of the CSV up to the end of its last complete line; a line still being written is
+    # left for a later read, as in read_appended
+    with open(csv_path, 'rb') as file:
+        end = file.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(end - block, 0)
+            file.seek(start)
+            newline = file.read(end - start).rfind(b'\n')
+            if newline >= 0:
+                return start + newline + 1
+            end = start
+    return 0
+
+
+def cache_is_fresh(csv_path, cache_path):
+    if not os.path.exists(cache_path):
+        return False
+    return not os.path.exists(csv_path) or os.path.getmtime(cache_path) >= os.path.getmtime(csv_path)
+
+
+def ingest(csv_path=CSV_PATH, cache_path=CACHE_PATH, size=None):
+    # Parse the CSV once, or only its first size bytes, and write the prepared columns to the
+    # cache. The cache is dated like the CSV it was parsed from, so any later change to the CSV
+    # makes it stale, and it is not written from part of the file.
+    status = os.stat(csv_path)
+    size = status.st_size if size is None else size
+    with open_prefix(csv_path, size) as source:
+        frame = prepare(pd.read_csv(source))
+    if size == status.st_size:
+        try:
+            frame.to_parquet(cache_path, index=False)
+            os.utime(cache_path, ns=(status.st_atime_ns, status.st_mtime_ns))
+        except (ImportError, OSError):
+            # No Parquet engine installed or the directory is read-only: serve from the CSV
+            pass
+    return frame
+
+
+def load_dataset(csv_path=CSV_PATH, cache_path=CACHE_PATH, size=None):
+    # Load the columnar cache, re-ingesting the CSV only when the cache is missing or stale. With
+    # a size, only the CSV's first size bytes are loaded, which the cache holds only while the CSV
+    # still has that size.
+    if (size is None or size == os.path.getsize(csv_path)) and cache_is_fresh(csv_path, cache_path):
+        try:
+            return pd.read_parquet(cache_path)
+        except ImportError:
+            pass
+    return ingest(csv_path, cache_path, size)
+
+
+# Prepared rows being aggregated in parallel, inherited by the forked workers instead of being
+# sent to them
+partitioned_frame = None
+
+
+def aggregation_pool(workers):
+    # Workers are forked, so they see the rows loaded before the pool was started
+    return multiprocessing.get_context('fork').Pool(workers)
+
+
+def pool_size(workers):
+    # A child forked while other threads run can inherit locks they hold and deadlock, so a load
+    # started with request or refresh threads around, e.g. the first request of a lazily loaded
+    # app, aggregates in this process
+    return workers if threading.active_count() == 1 else 1
+
+
+def state_partitions(frame, count):
+    # Row positions of the states split into up to count partitions of about the same size, each
+    # state going to the smallest partition so far, largest states first. Rows without a state
+    # are a group of their own.
+    groups = frame.groupby('state_abbr', observed=True, dropna=False, sort=False).ngroup().to_numpy()
+    states = np.split(np.argsort(groups, kind='stable'), np.cumsum(np.bincount(groups))[:-1])
+    partitions = [[] for _ in range(min(count, len(states)))]
+    sizes = [0] * len(partitions)
+    for positions in sorted(states, key=len, reverse=True):
+        smallest = sizes.index(min(sizes))
+        partitions[smallest].append(positions)
+        sizes[smallest] += len(positions)
+    return [np.concatenate(partition) for partition in partitions]
+
+
+def aggregate_partition(positions):
+    return partition_cells(partitioned_frame.take(positions).reset_index(drop=True), positions)
+
+
+def aggregate_frame(frame, workers=AGGREGATE_WORKERS):
+    # Aggregate prepared rows into a cube, with the rows of each state in a separate worker process
+    # when several workers are configured. Every cell belongs to one state, so the result is the
+    # same as aggregating the frame at once.
+    workers = pool_size(workers)
+    if workers <= 1:
+        return Cube.from_frame(frame)
+    global partitioned_frame
+    partitioned_frame = frame
+    try:
+        with aggregation_pool(workers) as pool:
+            parts = pool.map(aggregate_partition, state_partitions(frame, workers), chunksize=1)
+    finally:
+        partitioned_frame = None
+    return gather(parts)
+
+
+def aggregate_chunk(chunk):
+    return Cube.from_frame(prepare(chunk))
+
+
+def stream_aggregate(source=CSV_PATH, chunksize=STREAM_CHUNKSIZE, workers=AGGREGATE_WORKERS):
+    # Fold a CSV (path or buffer) into a cube one chunk at a time; raw rows are dropped after
+    # each chunk, so peak memory is bounded by the chunk size rather than the file size. With
+    # several workers, that many chunks are aggregated at once and folded in file order.
+    columns = [column for column in DIMENSIONS if column not in ('state_abbr', 'Age Group')] + ['Age'] + MEASURES
+    if not chunksize:
+        return aggregate_frame(prepare(pd.read_csv(source, usecols=columns)), workers)
+    chunks = pd.read_csv(source, usecols=columns, chunksize=chunksize)
+    cube = None
+    workers = pool_size(workers)
+    if workers <= 1:
+        for chunk in chunks:
+            partial = aggregate_chunk(chunk)
+            cube = partial if cube is None else combine([cube, partial])
+        return cube
+    with aggregation_pool(workers) as pool:
+        while batch := list(itertools.islice(chunks, workers)):
+            for partial in pool.map(aggregate_chunk, batch, chunksize=1):
+                cube = partial if cube is None else combine([cube, partial])
+    return cube
+
+
+def read_appended(csv_path, offset):
+    # Complete lines written after a byte offset, as a CSV buffer with the file's header,
+    # and the offset just past them; None when nothing new was written
+    with open(csv_path, 'rb') as file:
+        header = file.readline()
+        file.seek(max(offset, len(header)))
+        data = file.read()
+    end = data.rfind(b'\n') + 1
+    if not end:
+        return None, offset
+    return io.BytesIO(header + data[:end]), max(offset, len(header)) + end
+
+
+def load_cube(csv_path=CSV_PATH, cache_path=CACHE_PATH, chunksize=STREAM_CHUNKSIZE, backend=QUERY_BACKEND,
+              workers=AGGREGATE_WORKERS, size=None):
+    # Query the file with a SQL engine when one is configured, stream the CSV when a chunk size
+    # is configured, and otherwise aggregate the cached columns. size limits the pandas backend to
+    # the CSV's first bytes, e.g. its complete lines when the load started.
+    if backend != 'pandas':
+        from query_cube import open_query_cube
+        return open_query_cube(QUERY_SOURCE or csv_path, backend)
+    if chunksize:
+        if size is None:
+            return stream_aggregate(csv_path, chunksize, workers)
+        with open_prefix(csv_path, size) as source:
+            return stream_aggregate(source, chunksize, workers)
+    return aggregate_frame(load_dataset(csv_path, cache_path, size), workers)
+
+
+if __name__ == '__main__':
+    ingest()
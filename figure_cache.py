@@ -0,0 +1,145 @@
+import functools
+import gzip
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+from instrumentation import record_cache
+from settings import FIGURE_CACHE_SIZE, PRERENDERED_BUNDLE
+
+# Display order of checklist values, so any ordering of the same selection maps to one key
+VALUE_ORDER = ['Winter', 'Spring', 'Summer', 'Fall', 'Male', 'Female', 'Overall']
+
+
+def order_key(value):
+    if value in VALUE_ORDER:
+        return (0, VALUE_ORDER.index(value), '')
+    return (1, 0, str(value))
+
+
+def canonical(value):
+    # Checklist selections are order-insensitive sets
+    if isinstance(value, (list, tuple)):
+        return sorted(set(value), key=order_key)
+    return value
+
+
+def normalise(value):
+    # None, an empty string and an empty selection all mean "nothing chosen"
+    value = canonical(value)
+    if value is None or value == '' or value == []:
+        return None
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+
+def function_name(func):
+    # Module-qualified name of a function, the same when its module runs as a script
+    module = func.__module__
+    if module == '__main__':
+        module = os.path.splitext(os.path.basename(sys.modules['__main__'].__file__))[0]
+    return f'{module}.{func.__qualname__}'
+
+
+def cache_key(name, args):
+    return (name,) + tuple(normalise(arg) for arg in args)
+
+
+def blob_path(bundle, digest):
+    return os.path.join(bundle, 'figures', digest[:2], f'{digest}.json.gz')
+
+
+class Bundle:
+    # Outputs pre-rendered by prerender.py: an index from cache keys to content hashes, and one
+    # gzipped JSON file per distinct output; a tuple of outputs is indexed as a list of hashes
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'index.json')) as file:
+            self.index = json.load(file)['outputs']
+
+    def read(self, digest):
+        with gzip.open(blob_path(self.path, digest), 'rt') as file:
+            return json.load(file)
+
+    def get(self, key):
+        entry = self.index.get(repr(key))
+        if entry is None:
+            return False, None
+        if isinstance(entry, list):
+            return True, tuple(self.read(digest) for digest in entry)
+        return True, self.read(entry)
+
+
+class FigureCache:
+    # Bounded in-process memo of figures, evicting the least recently used entry, backed by a
+    # bundle of pre-rendered figures when one is configured
+
+    def __init__(self, maxsize=FIGURE_CACHE_SIZE, bundle=None):
+        self.maxsize = maxsize
+        self.bundle = bundle
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Bumped by every clear, so a figure drawn from data read before it is not stored after it
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True, self.entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value, generation=None):
+        # Entries started under an older generation than the current one are dropped
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+
+    def info(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries), 'maxsize': self.maxsize}
+
+    def memoize(self, func):
+        # Cache a figure-producing callback on its normalised inputs
+        name = function_name(func)
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            key = cache_key(name, args)
+            # Taken before the figure reads any data: a refresh swaps the data, then clears
+            generation = self.generation
+            found, figure = self.get(key)
+            if not found and self.bundle is not None:
+                found, figure = self.bundle.get(key)
+                if found:
+                    self.put(key, figure)
+            record_cache(found)
+            if not found:
+                figure = func(*(canonical(arg) for arg in args))
+                self.put(key, figure, generation)
+            return figure
+
+        return wrapper
+
+
+# Shared by every callback in the process
+figure_cache = FigureCache(bundle=Bundle(PRERENDERED_BUNDLE) if PRERENDERED_BUNDLE else None)
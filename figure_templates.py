@@ -0,0 +1,99 @@
+import threading
+
+# Largest marker size of plotly express bubble charts, which scales marker.sizeref
+SIZE_MAX = 20
+
+
+def with_paths(tree, values):
+    # A copy of nested dicts with dotted paths (e.g. 'title.text') set, copying only the dicts
+    # along those paths, so the rest stays shared with the original
+    tree = dict(tree)
+    for path, value in values.items():
+        node = tree
+        *parents, key = path.split('.')
+        for parent in parents:
+            node[parent] = dict(node.get(parent, {}))
+            node = node[parent]
+        node[key] = value
+    return tree
+
+
+def draw(builder, frame, layout):
+    # The full plotly figure of a frame, for charts with extras their template does not fill in
+    fig = builder(frame)
+    fig.update_layout(with_paths({}, layout))
+    return fig
+
+
+def column(name):
+    return lambda rows: rows[name].to_numpy()
+
+
+class FigureTemplate:
+    # A chart drawn once by its full plotly builder, then refilled per request. The layout and one
+    # trace of that figure are kept as plain dicts, and the figure of new data copies the trace per
+    # colour group with the group's arrays, so no figure object is built or validated per call.
+
+    def __init__(self, draw, arrays, group=None, colors=None):
+        # draw(frame) builds the full figure. arrays maps trace property paths to a column name or a
+        # function of a group's rows. Traces are split by the group column in order of appearance,
+        # like plotly express, and coloured from a mapping of group values, or else from a sequence
+        # (by default the template's colorway) in that order.
+        self.draw = draw
+        self.arrays = {path: column(values) if isinstance(values, str) else values for path, values in arrays.items()}
+        self.group = group
+        self.colors = colors
+        self.skeleton = None
+        self.lock = threading.Lock()
+
+    def learn(self, figure):
+        # Keep the layout and the first trace without its data, remembering the group it was drawn for
+        trace = {key: value for key, value in figure['data'][0].items() if key not in self.arrays}
+        if 'marker' in trace:
+            trace['marker'] = {key: value for key, value in trace['marker'].items() if f'marker.{key}' not in self.arrays}
+        colors = self.colors
+        if self.group is not None and colors is None:
+            colors = figure['layout']['template']['layout']['colorway']
+        return figure['layout'], trace, colors
+
+    def figure(self, frame, layout=None):
+        # The figure of a frame as a plain dict, with the dotted layout paths set for this request
+        layout = layout or {}
+        if self.skeleton is None or frame.empty:
+            # Empty frames are drawn in full, as plotly express draws them differently
+            figure = self.draw(frame).to_plotly_json()
+            if not figure['data']:
+                return dict(figure, layout=with_paths(figure['layout'], layout))
+            with self.lock:
+                if self.skeleton is None:
+                    self.skeleton = self.learn(figure)
+        base_layout, prototype, colors = self.skeleton
+
+        if self.group is None:
+            groups = [(None, frame)]
+        else:
+            groups = frame.groupby(self.group, observed=True, sort=False)
+        sizeref = None
+        if 'marker.size' in self.arrays:
+            sizeref = self.arrays['marker.size'](frame).max() / SIZE_MAX ** 2
+
+        traces = []
+        for position, (value, rows) in enumerate(groups):
+            values = {path: array(rows) for path, array in self.arrays.items()}
+            if sizeref is not None:
+                values['marker.sizeref'] = sizeref
+            if self.group is not None:
+                values.update(self.relabel(prototype, value))
+                values['marker.color'] = colors[value] if isinstance(colors, dict) else colors[position % len(colors)]
+            traces.append(with_paths(prototype, values))
+        return {'data': traces, 'layout': with_paths(base_layout, layout)}
+
+    @staticmethod
+    def relabel(prototype, value):
+        # The group-specific strings of a trace, renamed from the prototype's group to this one
+        drawn = prototype['name']
+        values = {key: value for key in ('name', 'legendgroup', 'offsetgroup') if key in prototype}
+        if 'hovertemplate' in prototype:
+            before, after = prototype['hovertemplate'].split(f'={drawn}', 1)
+            values['hovertemplate'] = f'{before}={value}{after}'
+        return values
@@ -1,304 +1,527 @@
-
-import pandas as pd
-import plotly.express as px
-import dash
-from dash import dcc, html
-from dash.dependencies import Input, Output
-import seaborn as sns
-
-# Load the dataset
-df = pd.read_csv('shopping_trends_updated.csv')
-
-# Mapping full state names to their abbreviations
-state_abbrev = {
-    'Alabama': 'AL', 'Alaska': 'AK', 'Arizona': 'AZ', 'Arkansas': 'AR',
-    'California': 'CA', 'Colorado': 'CO', 'Connecticut': 'CT', 'Delaware': 'DE',
-    'Florida': 'FL', 'Georgia': 'GA', 'Hawaii': 'HI', 'Idaho': 'ID',
-    'Illinois': 'IL', 'Indiana': 'IN', 'Iowa': 'IA', 'Kansas': 'KS',
-    'Kentucky': 'KY', 'Louisiana': 'LA', 'Maine': 'ME', 'Maryland': 'MD',
-    'Massachusetts': 'MA', 'Michigan': 'MI', 'Minnesota': 'MN', 'Mississippi': 'MS',
-    'Missouri': 'MO', 'Montana': 'MT', 'Nebraska': 'NE', 'Nevada': 'NV',
-    'New Hampshire': 'NH', 'New Jersey': 'NJ', 'New Mexico': 'NM', 'New York': 'NY',
-    'North Carolina': 'NC', 'North Dakota': 'ND', 'Ohio': 'OH', 'Oklahoma': 'OK',
-    'Oregon': 'OR', 'Pennsylvania': 'PA', 'Rhode Island': 'RI', 'South Carolina': 'SC',
-    'South Dakota': 'SD', 'Tennessee': 'TN', 'Texas': 'TX', 'Utah': 'UT',
-    'Vermont': 'VT', 'Virginia': 'VA', 'Washington': 'WA', 'West Virginia': 'WV',
-    'Wisconsin': 'WI', 'Wyoming': 'WY'
-}
-
-# Add a 'state_abbr' column to the DataFrame
-df['state_abbr'] = df['Location'].map(state_abbrev)
-
-# Bin the ages into 5-year intervals with a range from 15 to 70
-bins = list(range(15, 76, 5))
-labels = [f'{i}-{i+4}' for i in range(15, 71, 5)]
-df['Age Group'] = pd.cut(df['Age'], bins=bins, labels=labels, right=False)
-
-# Initialize the Dash app
-app = dash.Dash(__name__)
-
-# App layout
-app.layout = html.Div([
-    html.Div([
-        html.H1("Shopping Trends Dashboard", style={'textAlign': 'center', 'fontFamily': 'Helvetica', 'fontSize': '34px', 'padding': '20px 0'}),
-        html.P(
-            "Explore and analyze customer review ratings, purchase amounts, and trends across different states, seasons, and demographics. Use the filters to customize the visualizations and gain insights into shopping behaviors.",
-            style={'textAlign': 'center', 'fontFamily': 'Helvetica', 'fontSize': '20px', 'maxWidth': '800px', 'margin': '0 auto', 'padding': '10px 0'}
-        )
-    ], style={'backgroundColor': '#f9f9f9', 'padding': '20px', 'borderRadius': '10px', 'boxShadow': '0px 0px 15px rgba(0, 0, 0, 0.1)'}),
-    html.Div([
-        html.H2("Filter Options", style={'textAlign': 'left', 'fontFamily': 'Helvetica', 'fontSize': '28px', 'padding': '10px 0'}),
-        html.Div([
-            html.Div([
-                html.Label("Seasons", style={'fontFamily': 'Helvetica', 'fontSize': '20px'}),
-                dcc.Checklist(
-                    id='season-filter',
-                    options=[{'label': season, 'value': season} for season in df['Season'].unique()],
-                    value=list(df['Season'].unique()),  # Default to show all seasons
-                    inline=True,
-                    style={'fontFamily': 'Helvetica', 'fontSize': '18px'}
-                ),
-            ], style={'flex': '1', 'padding': '10px'}),
-            html.Div([
-                html.Label("State", style={'fontFamily': 'Helvetica', 'fontSize': '20px'}),
-                dcc.Dropdown(
-                    id='state-filter',
-                    options=[{'label': state, 'value': abbrev} for state, abbrev in state_abbrev.items()],
-                    placeholder="Select a state",
-                    clearable=True,
-                    style={'fontFamily': 'Helvetica', 'fontSize': '18px'}
-                ),
-            ], style={'flex': '1', 'padding': '10px'}),
-        ], style={'display': 'flex', 'flexWrap': 'wrap', 'margin': '0 -10px'})
-    ], style={'backgroundColor': '#f9f9f9', 'padding': '20px', 'borderRadius': '10px', 'boxShadow': '0px 0px 15px rgba(0, 0, 0, 0.1)', 'margin': '20px 0'}),
-    html.Div([
-        html.H2("Visualizations", style={'textAlign': 'left', 'fontFamily': 'Helvetica', 'fontSize': '28px', 'padding': '10px 0'}),
-        html.Div([
-            html.P("This map shows the average review ratings across different states for the selected seasons.",
-                   style={'fontFamily': 'Helvetica', 'fontSize': '18px'}),
-            dcc.Graph(id='choropleth-map', style={'width': '100%', 'height': '500px', 'marginBottom': '40px'}),
-        ], style={'padding': '10px'}),
-        html.Div([
-            html.P("This bar chart displays the average review ratings of different items purchased for the selected seasons.",
-                   style={'fontFamily': 'Helvetica', 'fontSize': '18px'}),
-            dcc.Graph(id='bar-chart', style={'width': '100%', 'height': '500px', 'marginBottom': '40px'}),
-        ], style={'padding': '10px'}),
-        html.Div([
-            html.P("This bubble plot aggregates shopping trends, showing review ratings, purchase amounts, and previous purchases for the selected seasons. The bubble size represents the total number of previous purchases.",
-                   style={'fontFamily': 'Helvetica', 'fontSize': '18px'}),
-            dcc.Graph(id='bubble-plot', style={'width': '100%', 'height': '500px', 'marginBottom': '40px'}),
-        ], style={'padding': '10px'}),
-        html.Div([
-            html.P("This line plot shows the average review ratings by age group and gender for the selected seasons.",
-                   style={'fontFamily': 'Helvetica', 'fontSize': '18px'}),
-            dcc.Checklist(
-                id='gender-overall-checklist',
-                options=[
-                    {'label': 'Male', 'value': 'Male'},
-                    {'label': 'Female', 'value': 'Female'},
-                    {'label': 'Overall', 'value': 'Overall'}
-                ],
-                value=['Male', 'Female', 'Overall'],
-                inline=True,
-                style={'fontFamily': 'Helvetica', 'fontSize': '18px'}
-            ),
-            dcc.Graph(id='scatter-plot', style={'width': '100%', 'height': '500px', 'marginBottom': '40px'}),
-        ], style={'padding': '10px'})
-    ], style={'backgroundColor': '#f9f9f9', 'padding': '20px', 'borderRadius': '10px', 'boxShadow': '0px 0px 15px rgba(0, 0, 0, 0.1)', 'margin': '20px 0'})
-])
-
-# Callback to update the choropleth map
-@app.callback(
-    Output('choropleth-map', 'figure'),
-    [Input('season-filter', 'value'),
-     Input('state-filter', 'value')]
-)
-def update_map(selected_seasons, selected_state):
-    # Filter the data based on the selected seasons
-    filtered_df = df[df['Season'].isin(selected_seasons)]
-
-    # Aggregate the data to get the average review rating per state
-    avg_ratings = filtered_df.groupby(['Location', 'state_abbr'])['Review Rating'].mean().reset_index()
-
-    if selected_state:
-        avg_ratings = avg_ratings[avg_ratings['state_abbr'] == selected_state]
-
-    # Create the choropleth map
-    fig = px.choropleth(
-        avg_ratings,
-        locations='state_abbr',
-        locationmode='USA-states',
-        color='Review Rating',
-        color_continuous_scale='OrRd',
-        scope='usa',
-        labels={'Review Rating': 'Avg Review Rating'},
-        title=f'Average Review Ratings by State for {", ".join(selected_seasons)}',
-        hover_data={'Location': True, 'state_abbr': False}
-    )
-
-    fig.update_layout(
-        geo=dict(
-            lakecolor='rgb(255, 255, 255)'
-        ),
-        coloraxis_colorbar=dict(
-            title="Avg Review Rating",
-            thickness=50,  # Enlarged thickness
-            len=1.0  # Enlarged length of the color bar
-        ),
-        font=dict(size=16)  # Enlarges numbers on the axis
-    )
-
-    return fig
-
-# Callback to update the bar chart
-@app.callback(
-    Output('bar-chart', 'figure'),
-    [Input('season-filter', 'value'),
-     Input('state-filter', 'value')]
-)
-def update_bar_chart(selected_seasons, selected_state):
-    # Filter the data based on the selected seasons
-    filtered_df = df[df['Season'].isin(selected_seasons)]
-
-    # If a state is selected, further filter the data
-    if selected_state:
-        filtered_df = filtered_df[filtered_df['state_abbr'] == selected_state]
-
-    # Calculate the average review rating for each item purchased
-    avg_ratings = filtered_df.groupby(['Item Purchased'])['Review Rating'].mean().reset_index()
-
-    # Merge with category data
-    avg_ratings = avg_ratings.merge(filtered_df[['Item Purchased', 'Category']].drop_duplicates(), on='Item Purchased')
-
-    # Sort the items by average review rating in descending order
-    sorted_df = avg_ratings.sort_values(by='Review Rating', ascending=False)
-
-    # Define the color palette 
-    custom_palette = ["#EE82EE", "#87CEFA", "#3CB371", "#F4A460"]
-
-    # Create the bar chart, coloring by category with a fixed color map
-    fig = px.bar(
-        sorted_df,
-        x='Review Rating',
-        y='Item Purchased',
-        color='Category',  # Color bars by category
-        color_discrete_sequence=custom_palette,  # Apply the spectral color palette
-        orientation='h',
-        labels={'Review Rating': 'Average Review Rating', 'Item Purchased': 'Item Purchased'},
-        title=f'Average Review Ratings by Item Purchased for {", ".join(selected_seasons)}',
-    )
-
-    fig.update_layout(
-        xaxis=dict(range=[sorted_df['Review Rating'].min() - 0.1, sorted_df['Review Rating'].max()]),
-        xaxis_title=dict(font=dict(size=18)),  # Enlarged axis title
-        yaxis_title=dict(font=dict(size=18)),  # Enlarged axis title
-        height=600,
-        margin=dict(l=50, r=50, t=50, b=50),
-        yaxis={'categoryorder': 'total ascending'},  # Ensures sorting by review rating
-        font=dict(size=16)  # Enlarges numbers on the axis
-    )
-    return fig
-
-# Callback to update the bubble plot
-@app.callback(
-    Output('bubble-plot', 'figure'),
-    [Input('season-filter', 'value'),
-     Input('state-filter', 'value')]
-)
-def update_bubble_plot(selected_seasons, selected_state):
-    # Filter the data based on the selected seasons
-    filtered_df = df[df['Season'].isin(selected_seasons)]
-
-    # If a state is selected, further filter the data
-    if selected_state:
-        filtered_df = filtered_df[filtered_df['state_abbr'] == selected_state]
-
-    # Aggregate data for the bubble plot
-    aggregated_data = filtered_df.groupby(['Item Purchased', 'Category']).agg({
-        'Review Rating': 'mean',
-        'Purchase Amount (USD)': 'mean',
-        'Previous Purchases': 'sum'
-    }).reset_index()
-
-    custom_palette = ["#EE82EE", "#87CEFA", "#3CB371", "#F4A460"]
-
-    # Create the bubble plot
-    fig = px.scatter(
-        data_frame=aggregated_data,
-        x='Purchase Amount (USD)',
-        y='Review Rating',
-        size='Previous Purchases',
-        color='Category',
-        hover_name='Item Purchased',
-        title=f'Aggregated Bubble Plot of Shopping Trends for {", ".join(selected_seasons)}',
-        labels={
-            'Purchase Amount (USD)': 'Purchase Amount (USD)',
-            'Review Rating': 'Review Rating',
-            'Previous Purchases': 'Previous Purchases',
-            'Category': 'Category'
-        },
-        color_discrete_sequence=custom_palette  # Apply the custom color palette
-    )
-
-    fig.update_traces(marker=dict(line=dict(width=2, color='DarkSlateGrey')))  # Add outline to bubbles
-
-    
-    fig.update_layout(
-        height=600,
-        xaxis_title=dict(font=dict(size=18)),  # Enlarged axis title
-        yaxis_title=dict(font=dict(size=18)),  # Enlarged axis title
-        margin=dict(l=50, r=50, t=50, b=50),
-        font=dict(size=16)  # Enlarges numbers on the axis
-    )
-    return fig
-
-# Callback to update the scatter plot
-@app.callback(
-    Output('scatter-plot', 'figure'),
-    [Input('gender-overall-checklist', 'value'),
-     Input('season-filter', 'value'),
-     Input('state-filter', 'value')]
-)
-def update_scatter_plot(selected_overall_genders, selected_seasons, selected_state):
-    # Filter the data based on the selected seasons
-    filtered_df = df[df['Season'].isin(selected_seasons)]
-
-    # If a state is selected, further filter the data
-    if selected_state:
-      filtered_df = filtered_df[filtered_df['state_abbr'] == selected_state]
-
-    # Recalculate the average review rating for each age group and gender
-    average_ratings_filtered = filtered_df.groupby(['Age Group', 'Gender'])['Review Rating'].mean().reset_index()
-
-    # Calculate the overall average review rating for each age group
-    overall_average_ratings = filtered_df.groupby(['Age Group'])['Review Rating'].mean().reset_index()
-    overall_average_ratings['Gender'] = 'Overall'
-
-    # Combine the average ratings for male, female, and overall
-    combined_ratings = pd.concat([average_ratings_filtered, overall_average_ratings])
-
-    # Filter the combined ratings based on selected overall genders
-    combined_ratings = combined_ratings[combined_ratings['Gender'].isin(selected_overall_genders)]
-
-    # Create the scatter plot
-    fig = px.scatter(
-        combined_ratings,
-        x='Age Group',
-        y='Review Rating',
-        color='Gender',
-        color_discrete_map={'Male': '#3CB371', 'Female': '#EE82EE', 'Overall': '#000000'},
-        labels={'Age Group': 'Age Group', 'Review Rating': 'Average Review Rating'},
-        title='Average Review Rating by Age Group and Gender'
-    )
-    fig.update_traces(mode='markers+lines')
-
-    fig.update_layout(
-        xaxis_title=dict(font=dict(size=18)),  # Enlarged axis title
-        yaxis_title=dict(font=dict(size=18)),  # Enlarged axis title
-        font=dict(size=16)  # Enlarges numbers on the axis
-    )
-
-    return fig
-
-if __name__ == '__main__':
+import pandas as pd
+import dash
+from dash import dcc, html, no_update
+from dash.dependencies import ClientsideFunction, Input, Output
+import instrumentation
+import settings
+from app_data import AGE_BIN_WIDTH, age_edges, data, item_rollup
+from callbacks import CallbackRegistry, callback_if, compression_enabled, lazy_import, triggered_inputs
+from clientside import age_gender_store, chart_store, template_store
+from dataset import state_abbrev
+from figure_cache import figure_cache
+from figure_templates import FigureTemplate, draw
+from instrumentation import timed
+
+# Imported when the first figure is drawn
+px = lazy_import('plotly.express')
+
+# Callbacks declared below, registered on every app create_app() builds
+registry = CallbackRegistry()
+
+# App layout, with the season options of the loaded data
+def build_layout(seasons):
+    return html.Div([
+        html.Div([
+            html.H1("Shopping Trends Dashboard", style={'textAlign': 'center', 'fontFamily': 'Helvetica', 'fontSize': '34px', 'padding': '20px 0'}),
+            html.P(
+                "Explore and analyze customer review ratings, purchase amounts, and trends across different states, seasons, and demographics. Use the filters to customize the visualizations and gain insights into shopping behaviors.",
+                style={'textAlign': 'center', 'fontFamily': 'Helvetica', 'fontSize': '20px', 'maxWidth': '800px', 'margin': '0 auto', 'padding': '10px 0'}
+            )
+        ], style={'backgroundColor': '#f9f9f9', 'padding': '20px', 'borderRadius': '10px', 'boxShadow': '0px 0px 15px rgba(0, 0, 0, 0.1)'}),
+        html.Div([
+            html.H2("Filter Options", style={'textAlign': 'left', 'fontFamily': 'Helvetica', 'fontSize': '28px', 'padding': '10px 0'}),
+            html.Div([
+                html.Div([
+                    html.Label("Seasons", style={'fontFamily': 'Helvetica', 'fontSize': '20px'}),
+                    dcc.Checklist(
+                        id='season-filter',
+                        options=[{'label': season, 'value': season} for season in seasons],
+                        value=seasons,  # Default to show all seasons
+                        inline=True,
+                        style={'fontFamily': 'Helvetica', 'fontSize': '18px'}
+                    ),
+                ], style={'flex': '1', 'padding': '10px'}),
+                html.Div([
+                    html.Label("State", style={'fontFamily': 'Helvetica', 'fontSize': '20px'}),
+                    dcc.Dropdown(
+                        id='state-filter',
+                        options=[{'label': state, 'value': abbrev} for state, abbrev in state_abbrev.items()],
+                        placeholder="Select a state",
+                        clearable=True,
+                        style={'fontFamily': 'Helvetica', 'fontSize': '18px'}
+                    ),
+                ], style={'flex': '1', 'padding': '10px'}),
+            ], style={'display': 'flex', 'flexWrap': 'wrap', 'margin': '0 -10px'})
+        ], style={'backgroundColor': '#f9f9f9', 'padding': '20px', 'borderRadius': '10px', 'boxShadow': '0px 0px 15px rgba(0, 0, 0, 0.1)', 'margin': '20px 0'}),
+        html.Div([
+            html.H2("Visualizations", style={'textAlign': 'left', 'fontFamily': 'Helvetica', 'fontSize': '28px', 'padding': '10px 0'}),
+            html.Div([
+                html.P("This map shows the average review ratings across different states for the selected seasons.",
+                       style={'fontFamily': 'Helvetica', 'fontSize': '18px'}),
+                dcc.Graph(id='choropleth-map', style={'width': '100%', 'height': '500px', 'marginBottom': '40px'}),
+            ], style={'padding': '10px'}),
+            html.Div([
+                html.P("This bar chart displays the average review ratings of different items purchased for the selected seasons.",
+                       style={'fontFamily': 'Helvetica', 'fontSize': '18px'}),
+                dcc.Graph(id='bar-chart', style={'width': '100%', 'height': '500px', 'marginBottom': '40px'}),
+            ], style={'padding': '10px'}),
+            html.Div([
+                html.P("This bubble plot aggregates shopping trends, showing review ratings, purchase amounts, and previous purchases for the selected seasons. The bubble size represents the total number of previous purchases.",
+                       style={'fontFamily': 'Helvetica', 'fontSize': '18px'}),
+                dcc.Graph(id='bubble-plot', style={'width': '100%', 'height': '500px', 'marginBottom': '40px'}),
+            ], style={'padding': '10px'}),
+            html.Div([
+                html.P("This line plot shows the average review ratings by age group and gender for the selected seasons.",
+                       style={'fontFamily': 'Helvetica', 'fontSize': '18px'}),
+                dcc.Checklist(
+                    id='gender-overall-checklist',
+                    options=[
+                        {'label': 'Male', 'value': 'Male'},
+                        {'label': 'Female', 'value': 'Female'},
+                        {'label': 'Overall', 'value': 'Overall'}
+                    ],
+                    value=['Male', 'Female', 'Overall'],
+                    inline=True,
+                    style={'fontFamily': 'Helvetica', 'fontSize': '18px'}
+                ),
+                html.Div([
+                    html.Label("Age group width (years)", style={'fontFamily': 'Helvetica', 'fontSize': '18px'}),
+                    dcc.Slider(
+                        id='age-bin-width',
+                        min=1, max=20, step=1, value=AGE_BIN_WIDTH,
+                        marks={width: str(width) for width in (1, 5, 10, 15, 20)},
+                        # A pre-rendered bundle only holds the default age groups
+                        disabled=bool(settings.PRERENDERED_BUNDLE)
+                    ),
+                    dcc.Input(
+                        id='age-bin-edges',
+                        type='text',
+                        debounce=True,
+                        placeholder="Custom age edges, e.g. 18, 25, 35, 50, 70",
+                        disabled=bool(settings.PRERENDERED_BUNDLE),
+                        style={'fontFamily': 'Helvetica', 'fontSize': '18px', 'width': '100%'}
+                    ),
+                ], style={'padding': '10px 0'}),
+                dcc.Graph(id='scatter-plot', style={'width': '100%', 'height': '500px', 'marginBottom': '40px'}),
+            ], style={'padding': '10px'})
+        ], style={'backgroundColor': '#f9f9f9', 'padding': '20px', 'borderRadius': '10px', 'boxShadow': '0px 0px 15px rgba(0, 0, 0, 0.1)', 'margin': '20px 0'})
+    ])
+
+# Draw the choropleth map of average ratings per state; titles are set per request
+def draw_map(avg_ratings):
+    # Estimates from a sample show their confidence interval on hover
+    hover_data = {'Location': True, 'state_abbr': False}
+    if 'Review Rating ci' in avg_ratings:
+        hover_data['Review Rating ci'] = ':.2f'
+
+    # Create the choropleth map
+    fig = px.choropleth(
+        avg_ratings,
+        locations='state_abbr',
+        locationmode='USA-states',
+        color='Review Rating',
+        color_continuous_scale='OrRd',
+        scope='usa',
+        title='Average Review Ratings by State',
+        labels={'Review Rating': 'Avg Review Rating', 'Review Rating ci': '± (95% CI)'},
+        hover_data=hover_data
+    )
+
+    fig.update_layout(
+        geo=dict(
+            lakecolor='rgb(255, 255, 255)'
+        ),
+        coloraxis_colorbar=dict(
+            title="Avg Review Rating",
+            thickness=50,  # Enlarged thickness
+            len=1.0  # Enlarged length of the color bar
+        ),
+        font=dict(size=16)  # Enlarges numbers on the axis
+    )
+
+    return fig
+
+map_template = FigureTemplate(draw_map, {
+    'locations': 'state_abbr',
+    'z': 'Review Rating',
+    'customdata': lambda rows: rows[['Location', 'state_abbr']].to_numpy(),
+})
+
+# Build the choropleth map from the selected cells
+def build_map(cells, selected_seasons):
+    # Roll the cells up to the average review rating per state
+    avg_ratings = cells.rollup(['Location', 'state_abbr'], mean=['Review Rating'])
+    layout = {'title.text': f'Average Review Ratings by State for {", ".join(selected_seasons)}'}
+
+    # Estimates carry their confidence intervals as extra hover data, so they are drawn in full
+    if 'Review Rating ci' in avg_ratings:
+        return draw(draw_map, avg_ratings, layout)
+    return map_template.figure(avg_ratings, layout)
+
+# Define the color palette 
+custom_palette = ["#EE82EE", "#87CEFA", "#3CB371", "#F4A460"]
+
+# Draw the bar chart of average ratings per item
+def draw_bar_chart(sorted_df):
+    # Create the bar chart, coloring by category with a fixed color map
+    fig = px.bar(
+        sorted_df,
+        x='Review Rating',
+        y='Item Purchased',
+        color='Category',  # Color bars by category
+        color_discrete_sequence=custom_palette,  # Apply the spectral color palette
+        orientation='h',
+        labels={'Review Rating': 'Average Review Rating', 'Item Purchased': 'Item Purchased'},
+        error_x='Review Rating ci' if 'Review Rating ci' in sorted_df else None,  # Sample estimates only
+    )
+
+    fig.update_layout(
+        xaxis_title=dict(font=dict(size=18)),  # Enlarged axis title
+        yaxis_title=dict(font=dict(size=18)),  # Enlarged axis title
+        height=600,
+        margin=dict(l=50, r=50, t=50, b=50),
+        yaxis={'categoryorder': 'total ascending'},  # Ensures sorting by review rating
+        font=dict(size=16)  # Enlarges numbers on the axis
+    )
+    return fig
+
+bar_chart_template = FigureTemplate(draw_bar_chart, {'x': 'Review Rating', 'y': 'Item Purchased'},
+                                    group='Category', colors=custom_palette)
+
+# Build the bar chart from the selected cells
+def build_bar_chart(cells, selected_seasons):
+    # Calculate the average review rating for each item purchased, keeping its category
+    avg_ratings = cells.rollup(['Item Purchased', 'Category'], mean=['Review Rating'])
+
+    # Sort the items by average review rating in descending order. Averages equal up to rounding
+    # errors in their sums are ties, kept in roll-up order, so the client-side bar chart, which adds
+    # the cells up in another order, sorts them the same.
+    sorted_df = avg_ratings.sort_values(by='Review Rating', ascending=False, kind='stable',
+                                        key=lambda ratings: ratings.round(9))
+    layout = {
+        'title.text': f'Average Review Ratings by Item Purchased for {", ".join(selected_seasons)}',
+        'xaxis.range': [sorted_df['Review Rating'].min() - 0.1, sorted_df['Review Rating'].max()],
+    }
+
+    if 'Review Rating ci' in sorted_df:
+        return draw(draw_bar_chart, sorted_df, layout)
+    return bar_chart_template.figure(sorted_df, layout)
+
+# Draw the bubble plot of item aggregates
+def draw_bubble_plot(aggregated_data):
+    # Create the bubble plot
+    fig = px.scatter(
+        data_frame=aggregated_data,
+        x='Purchase Amount (USD)',
+        y='Review Rating',
+        size='Previous Purchases',
+        color='Category',
+        hover_name='Item Purchased',
+        labels={
+            'Purchase Amount (USD)': 'Purchase Amount (USD)',
+            'Review Rating': 'Review Rating',
+            'Previous Purchases': 'Previous Purchases',
+            'Category': 'Category'
+        },
+        color_discrete_sequence=custom_palette  # Apply the custom color palette
+    )
+
+    fig.update_traces(marker=dict(line=dict(width=2, color='DarkSlateGrey')))  # Add outline to bubbles
+
+    
+    fig.update_layout(
+        height=600,
+        xaxis_title=dict(font=dict(size=18)),  # Enlarged axis title
+        yaxis_title=dict(font=dict(size=18)),  # Enlarged axis title
+        margin=dict(l=50, r=50, t=50, b=50),
+        font=dict(size=16)  # Enlarges numbers on the axis
+    )
+    return fig
+
+# Columns of the bubble plot's traces
+bubble_plot_arrays = {
+    'x': 'Purchase Amount (USD)',
+    'y': 'Review Rating',
+    'marker.size': 'Previous Purchases',
+    'hovertext': 'Item Purchased',
+}
+
+bubble_plot_template = FigureTemplate(draw_bubble_plot, bubble_plot_arrays, group='Category', colors=custom_palette)
+
+# Build the bubble plot from the selected cells
+def build_bubble_plot(cells, selected_seasons):
+    # Aggregate data for the bubble plot
+    aggregated_data = item_rollup(cells, previous_purchases='total')
+    return bubble_plot_template.figure(
+        aggregated_data, {'title.text': f'Aggregated Bubble Plot of Shopping Trends for {", ".join(selected_seasons)}'}
+    )
+
+# Draw the line plot of average ratings per age group and gender
+def draw_scatter_plot(combined_ratings):
+    # Create the scatter plot
+    fig = px.scatter(
+        combined_ratings,
+        x='Age Group',
+        y='Review Rating',
+        color='Gender',
+        color_discrete_map=GENDER_COLORS,
+        labels={'Age Group': 'Age Group', 'Review Rating': 'Average Review Rating'},
+        title='Average Review Rating by Age Group and Gender'
+    )
+    fig.update_traces(mode='markers+lines')
+
+    fig.update_layout(
+        xaxis_title=dict(font=dict(size=18)),  # Enlarged axis title
+        yaxis_title=dict(font=dict(size=18)),  # Enlarged axis title
+        font=dict(size=16)  # Enlarges numbers on the axis
+    )
+
+    return fig
+
+GENDER_COLORS = {'Male': '#3CB371', 'Female': '#EE82EE', 'Overall': '#000000'}
+
+scatter_plot_template = FigureTemplate(draw_scatter_plot, {'x': 'Age Group', 'y': 'Review Rating'},
+                                       group='Gender', colors=GENDER_COLORS)
+
+# Build the scatter plot from the selected cells
+def build_scatter_plot(cells, selected_overall_genders, edges):
+    # Recalculate the average review rating for each age group and gender, re-binning the
+    # single-year ages into groups between the edges
+    average_ratings_filtered = cells.age_histogram.rollup(['Age Group', 'Gender'], edges)
+
+    # Calculate the overall average review rating for each age group
+    overall_average_ratings = cells.age_histogram.rollup(['Age Group'], edges)
+    overall_average_ratings['Gender'] = 'Overall'
+
+    # Combine the average ratings for male, female, and overall
+    combined_ratings = pd.concat([average_ratings_filtered, overall_average_ratings])
+
+    # Filter the combined ratings based on selected overall genders
+    combined_ratings = combined_ratings[combined_ratings['Gender'].isin(selected_overall_genders)]
+    return scatter_plot_template.figure(combined_ratings)
+
+# Callback to update the choropleth map, unless it is drawn client-side
+@callback_if(
+    registry, not settings.COALESCE_CALLBACKS and not settings.PROGRESSIVE_RENDERING and not settings.CLIENTSIDE_FILTERING,
+    Output('choropleth-map', 'figure'),
+    [Input('season-filter', 'value'),
+     Input('state-filter', 'value')],
+    layout_paths=['title.text']
+)
+@figure_cache.memoize
+def update_map(selected_seasons, selected_state):
+    return build_map(data.cube.subset(seasons=selected_seasons, state=selected_state), selected_seasons)
+
+# Callback to update the bar chart, unless it is drawn client-side
+@callback_if(
+    registry, not settings.COALESCE_CALLBACKS and not settings.PROGRESSIVE_RENDERING and not settings.CLIENTSIDE_FILTERING,
+    Output('bar-chart', 'figure'),
+    [Input('season-filter', 'value'),
+     Input('state-filter', 'value')],
+    layout_paths=['title.text', 'xaxis.range']
+)
+@figure_cache.memoize
+def update_bar_chart(selected_seasons, selected_state):
+    return build_bar_chart(data.cube.subset(seasons=selected_seasons, state=selected_state), selected_seasons)
+
+# Callback to update the bubble plot, unless it is drawn client-side
+@callback_if(
+    registry, not settings.COALESCE_CALLBACKS and not settings.CLIENTSIDE_FILTERING,
+    Output('bubble-plot', 'figure'),
+    [Input('season-filter', 'value'),
+     Input('state-filter', 'value')],
+    layout_paths=['title.text']
+)
+@figure_cache.memoize
+def update_bubble_plot(selected_seasons, selected_state):
+    return build_bubble_plot(data.cube.subset(seasons=selected_seasons, state=selected_state), selected_seasons)
+
+# Callback to update the scatter plot, unless it is drawn client-side
+@callback_if(
+    registry, not settings.COALESCE_CALLBACKS and not settings.CLIENTSIDE_FILTERING,
+    Output('scatter-plot', 'figure'),
+    [Input('gender-overall-checklist', 'value'),
+     Input('season-filter', 'value'),
+     Input('state-filter', 'value'),
+     Input('age-bin-width', 'value'),
+     Input('age-bin-edges', 'value')],
+    layout_paths=[]
+)
+@figure_cache.memoize
+def update_scatter_plot(selected_overall_genders, selected_seasons, selected_state, bin_width=AGE_BIN_WIDTH, custom_edges=None):
+    return build_scatter_plot(data.cube.subset(seasons=selected_seasons, state=selected_state), selected_overall_genders,
+                              age_edges(bin_width, custom_edges))
+
+# Coalesced callback updating every chart in one request
+@callback_if(
+    registry, settings.COALESCE_CALLBACKS and not settings.CLIENTSIDE_FILTERING,
+    [Output('choropleth-map', 'figure'),
+     Output('bar-chart', 'figure'),
+     Output('bubble-plot', 'figure'),
+     Output('scatter-plot', 'figure')],
+    [Input('season-filter', 'value'),
+     Input('state-filter', 'value'),
+     Input('gender-overall-checklist', 'value'),
+     Input('age-bin-width', 'value'),
+     Input('age-bin-edges', 'value')],
+    layout_paths=[['title.text'], ['title.text', 'xaxis.range'], ['title.text'], []]
+)
+def update_figures(selected_seasons, selected_state, selected_overall_genders, bin_width, custom_edges):
+    # Toggling a gender or re-binning the ages only changes the scatter plot
+    triggered = triggered_inputs()
+    if triggered and triggered <= {'gender-overall-checklist', 'age-bin-width', 'age-bin-edges'}:
+        return no_update, no_update, no_update, update_scatter_plot(selected_overall_genders, selected_seasons,
+                                                                    selected_state, bin_width, custom_edges)
+    return update_all_figures(selected_seasons, selected_state, selected_overall_genders, bin_width, custom_edges)
+
+@figure_cache.memoize
+def update_all_figures(selected_seasons, selected_state, selected_overall_genders, bin_width=AGE_BIN_WIDTH, custom_edges=None):
+    # Filter once; every chart rolls up the same selected cells
+    cells = data.cube.subset(seasons=selected_seasons, state=selected_state)
+    return (build_map(cells, selected_seasons),
+            build_bar_chart(cells, selected_seasons),
+            build_bubble_plot(cells, selected_seasons),
+            build_scatter_plot(cells, selected_overall_genders, age_edges(bin_width, custom_edges)))
+
+# Estimate the map and bar chart from the sample first, then ask for the exact figure of every
+# chart whose estimates are not within the error threshold
+@figure_cache.memoize
+def estimate_figures(selected_seasons, selected_state):
+    cells = data.sample.subset(seasons=selected_seasons, state=selected_state)
+    figures = {'map': build_map(cells, selected_seasons), 'bar': build_bar_chart(cells, selected_seasons)}
+    pending = []
+    for chart, groups in (('map', ['Location', 'state_abbr']), ('bar', ['Item Purchased', 'Category'])):
+        if not cells.accurate(groups):
+            pending.append(chart)
+            figures[chart].update_layout(title_text=f'{figures[chart].layout.title.text} (estimate)')
+    return figures['map'], figures['bar'], pending
+
+@callback_if(
+    registry, settings.PROGRESSIVE_RENDERING and not settings.COALESCE_CALLBACKS,
+    [Output('choropleth-map', 'figure'),
+     Output('bar-chart', 'figure'),
+     Output('exact-request', 'data')],
+    [Input('season-filter', 'value'),
+     Input('state-filter', 'value')],
+    layout_paths=[['title.text'], ['title.text', 'xaxis.range'], None]
+)
+def update_estimated_figures(selected_seasons, selected_state):
+    map_figure, bar_figure, pending = estimate_figures(selected_seasons, selected_state)
+    if not pending:
+        return map_figure, bar_figure, no_update
+    return map_figure, bar_figure, {'seasons': selected_seasons, 'state': selected_state, 'charts': pending}
+
+# Replace the estimates once the exact figures are computed
+@callback_if(
+    registry, settings.PROGRESSIVE_RENDERING and not settings.COALESCE_CALLBACKS,
+    [Output('choropleth-map', 'figure', allow_duplicate=True),
+     Output('bar-chart', 'figure', allow_duplicate=True)],
+    Input('exact-request', 'data'),
+    prevent_initial_call=True,
+    layout_paths=[['title.text'], ['title.text', 'xaxis.range']]
+)
+def update_exact_figures(request):
+    seasons, state = request['seasons'], request['state']
+    return (update_map(seasons, state) if 'map' in request['charts'] else no_update,
+            update_bar_chart(seasons, state) if 'bar' in request['charts'] else no_update)
+
+# Draw the scatter plot in the browser from cells shipped once with the layout; cached until
+# the data is refreshed
+@figure_cache.memoize
+def client_cells():
+    cells = data.cube
+    return age_gender_store(cells, build_scatter_plot(cells, ['Male', 'Female', 'Overall'], age_edges()))
+
+# Draw the map, bar chart and bubble plot in the browser from sums and counts per season, state
+# and item shipped once with the layout, in the styling of the server's figures; cached until the
+# data is refreshed
+@figure_cache.memoize
+def chart_cells():
+    cells, seasons = data.cube, season_options()
+    empty = cells.subset(seasons=[])
+    # Drawn once, so the templates have learnt their styling
+    build_map(cells, seasons), build_bar_chart(cells, seasons), build_bubble_plot(cells, seasons)
+    return chart_store(cells, {
+        'map': template_store(map_template, build_map(empty, [])),
+        'bar': template_store(bar_chart_template, build_bar_chart(empty, [])),
+        'bubble': dict(template_store(bubble_plot_template, build_bubble_plot(empty, [])),
+                       arrays=bubble_plot_arrays, total=['Previous Purchases']),
+    })
+
+if settings.CLIENTSIDE_FILTERING:
+    for function_name, chart in (('choropleth_map', 'choropleth-map'), ('bar_chart', 'bar-chart'),
+                                 ('bubble_plot', 'bubble-plot')):
+        registry.clientside_callback(
+            ClientsideFunction(namespace='shopping', function_name=function_name),
+            Output(chart, 'figure'),
+            [Input('chart-cells', 'data'),
+             Input('season-filter', 'value'),
+             Input('state-filter', 'value')]
+        )
+    registry.clientside_callback(
+        ClientsideFunction(namespace='shopping', function_name='scatter_plot'),
+        Output('scatter-plot', 'figure'),
+        [Input('age-gender-cells', 'data'),
+         Input('season-filter', 'value'),
+         Input('state-filter', 'value'),
+         Input('gender-overall-checklist', 'value'),
+         Input('age-bin-width', 'value'),
+         Input('age-bin-edges', 'value')]
+    )
+
+# Season options of the current data; cached until the data is refreshed
+@figure_cache.memoize
+def season_options():
+    return data.cube.seasons()
+
+# Layout of a page load, from the current data
+def serve_layout():
+    layout = build_layout(season_options())
+    if settings.CLIENTSIDE_FILTERING:
+        layout.children.append(dcc.Store(id='age-gender-cells', data=client_cells()))
+        layout.children.append(dcc.Store(id='chart-cells', data=chart_cells()))
+    if settings.PROGRESSIVE_RENDERING and not settings.COALESCE_CALLBACKS:
+        layout.children.append(dcc.Store(id='exact-request'))
+    return layout
+
+# Build a Dash app serving this dashboard, on its own Flask server or under url_base_pathname
+# of a shared one; no data is read until the first page or callback
+def create_app(server=True, url_base_pathname=None):
+    with timed('create app'):
+        app = dash.Dash(__name__, server=server, url_base_pathname=url_base_pathname,
+                        compress=compression_enabled())
+        instrumentation.install(app)
+        # Dash checks callbacks against this data-free layout instead of calling serve_layout
+        app.validation_layout = html.Div([build_layout([]), dcc.Store(id='age-gender-cells'),
+                                          dcc.Store(id='chart-cells'), dcc.Store(id='exact-request')])
+        app.layout = serve_layout
+        registry.register(app)
+    return app
+
+# Load the data, import the plotting library and build the layout ahead of the first request,
+# returning the seconds spent per startup step
+def warm_up():
+    # A pre-rendered bundle answers every callback, so the data is not read at all
+    if not settings.PRERENDERED_BUNDLE:
+        data.load()
+    if settings.PROGRESSIVE_RENDERING:
+        data.sample
+    with timed('import plotting'):
+        px.bar
+    with timed('build layout'):
+        serve_layout()
+    # Draw each chart once, so the first request only fills in its template
+    if not settings.PRERENDERED_BUNDLE:
+        with timed('draw figure templates'):
+            cells, seasons = data.cube, season_options()
+            build_map(cells, seasons), build_bar_chart(cells, seasons), build_bubble_plot(cells, seasons)
+            build_scatter_plot(cells, ['Male', 'Female', 'Overall'], age_edges())
+    return dict(instrumentation.startup_seconds)
+
+app = create_app()
+
+# WSGI entry point for production servers, e.g. serve.py or `gunicorn good_visualization:server`
+server = app.server
+
+if __name__ == '__main__':
     app.run_server(debug=True, port=8050)
\ No newline at end of file
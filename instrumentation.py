@@ -0,0 +1,189 @@
+import contextlib
+import functools
+import threading
+import time
+
+from settings import INSTRUMENT_CALLBACKS
+
+# Measurements of the callback running on this thread, if it is instrumented
+local = threading.local()
+
+PHASES = ['filter', 'aggregate', 'figure', 'serialize', 'total']
+
+# Seconds spent in each startup step (importing, loading the data, ...), in the order they ran
+startup_seconds = {}
+
+
+def label_text(labels):
+    return ','.join(f'{key}="{value}"' for key, value in labels)
+
+
+class Histogram:
+    # Cumulative bucket counts, sum and count per label set, in the Prometheus text format
+
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            counts = self.series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            for key, counts in sorted(self.series.items()):
+                labels = label_text(key)
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {counts[-1]}')
+                lines.append(f'{self.name}_sum{{{labels}}} {counts[-2]}')
+                lines.append(f'{self.name}_count{{{labels}}} {counts[-1]}')
+        return lines
+
+
+class Counter:
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def inc(self, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        with self.lock:
+            for key, value in sorted(self.series.items()):
+                lines.append(f'{self.name}_total{{{label_text(key)}}} {value}')
+        return lines
+
+
+phase_seconds = Histogram('dash_callback_phase_seconds', 'Time spent per callback phase.',
+                          [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5])
+rows_scanned = Histogram('dash_callback_rows_scanned', 'Aggregate cells read per callback.',
+                         [10, 100, 1000, 10_000, 100_000, 1_000_000])
+payload_bytes = Histogram('dash_callback_payload_bytes', 'Size of the serialised callback response.',
+                          [1_000, 10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 5_000_000])
+cache_lookups = Counter('dash_callback_cache_lookups', 'Figure and shared aggregate cache lookups per callback and result.')
+
+
+@contextlib.contextmanager
+def phase(name):
+    # Time a block of the current callback, e.g. phase('filter'); free when not instrumented
+    current = getattr(local, 'current', None)
+    if current is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        current['phases'][name] += time.perf_counter() - started
+
+
+def record_rows(rows):
+    current = getattr(local, 'current', None)
+    if current is not None:
+        current['rows'] += rows
+
+
+def record_cache(hit, cache='figure'):
+    current = getattr(local, 'current', None)
+    if current is not None:
+        cache_lookups.inc(callback=current['callback'], cache=cache, result='hit' if hit else 'miss')
+
+
+@contextlib.contextmanager
+def timed(step):
+    # Time a startup step, whether or not callbacks are instrumented
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_seconds[step] = startup_seconds.get(step, 0.0) + time.perf_counter() - started
+
+
+def startup_report():
+    return ', '.join(f'{step} {seconds:.2f}s' for step, seconds in startup_seconds.items())
+
+
+def serialise(result):
+    # Serialise the outputs the way Dash does, skipping outputs that are not sent
+    import dash
+    from plotly.io.json import to_json_plotly
+
+    outputs = result if isinstance(result, tuple) else (result,)
+    return to_json_plotly([output for output in outputs if output is not dash.no_update])
+
+
+def instrument(func):
+    # Record per-phase timings, cells read, payload size and cache hits of a Dash callback.
+    # The response is serialised once more here to time it, so this costs extra CPU while enabled.
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args):
+        local.current = current = {'callback': name, 'phases': dict.fromkeys(PHASES, 0.0), 'rows': 0}
+        started = time.perf_counter()
+        try:
+            result = func(*args)
+        finally:
+            local.current = None
+        elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        payload = len(serialise(result))
+        phases = current['phases']
+        phases['serialize'] = time.perf_counter() - started
+        phases['figure'] = max(elapsed - phases['filter'] - phases['aggregate'], 0.0)
+        phases['total'] = elapsed + phases['serialize']
+
+        for phase_name, seconds in phases.items():
+            phase_seconds.observe(seconds, callback=name, phase=phase_name)
+        rows_scanned.observe(current['rows'], callback=name)
+        payload_bytes.observe(payload, callback=name)
+        return result
+
+    return wrapper
+
+
+def render_metrics():
+    from figure_cache import figure_cache
+
+    lines = []
+    for metric in (phase_seconds, rows_scanned, payload_bytes, cache_lookups):
+        lines.extend(metric.render())
+    for key, value in figure_cache.info().items():
+        lines.append(f'# TYPE figure_cache_{key} gauge')
+        lines.append(f'figure_cache_{key} {value}')
+    lines.append('# TYPE dash_startup_seconds gauge')
+    for step, seconds in startup_seconds.items():
+        lines.append(f'dash_startup_seconds{{step="{step}"}} {seconds}')
+    return '\n'.join(lines) + '\n'
+
+
+def install(app):
+    # Expose the metrics on a Prometheus-style /metrics route of the app's Flask server
+    # Dashboards sharing one server share the route too
+    if not INSTRUMENT_CALLBACKS or 'metrics' in app.server.view_functions:
+        return
+    from flask import Response
+
+    app.server.add_url_rule(
+        '/metrics', 'metrics',
+        lambda: Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+    )
@@ -0,0 +1,302 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import settings
+from benchmark import REPO_DIR, summarise
+
+# Filters a simulated user changes, and how often each is picked for an interaction
+INTERACTIONS = {
+    'season-filter': 4,
+    'state-filter': 3,
+    'gender-checklist': 2,
+    'gender-overall-checklist': 2,
+}
+
+# Requests a browser sends to one host at once, so a user's callbacks for one change run in parallel
+BROWSER_CONNECTIONS = 6
+
+# Longest chain of callbacks triggered by other callbacks' outputs followed per interaction
+MAX_CHAIN = 10
+
+
+def components(layout):
+    # Props of every component with an id in a serialised Dash layout
+    found = {}
+    pending = [layout]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, list):
+            pending.extend(node)
+        elif isinstance(node, dict):
+            props = node.get('props', {})
+            if 'id' in props:
+                found[props['id']] = props
+            pending.extend(props.values())
+    return found
+
+
+def output_specs(output):
+    # (id, property) of each output of a callback, from Dash's '..a.figure...b.figure..' notation
+    outputs = output[2:-2].split('...') if output.startswith('..') else [output]
+    return [tuple(output.split('.', 1)) for output in outputs]
+
+
+def output_props(output):
+    # 'id.prop' of each output, without the suffix of outputs that allow duplicates
+    return [f'{component}.{prop.split("@")[0]}' for component, prop in output_specs(output)]
+
+
+def option_values(options):
+    return [option['value'] if isinstance(option, dict) else option for option in options or []]
+
+
+class Dashboard:
+    # The server-side callbacks and initial filter values of a served dashboard, read from its
+    # Dash endpoints, and the requests the Dash renderer makes for a page load or a filter change
+
+    def __init__(self, url, timeout):
+        self.url = url
+        self.timeout = timeout
+        dependencies = requests.get(f'{url}_dash-dependencies', timeout=timeout).json()
+        self.callbacks = [callback for callback in dependencies if not callback.get('clientside_function')]
+        self.props = components(requests.get(f'{url}_dash-layout', timeout=timeout).json())
+
+        inputs = {f'{item["id"]}.{item["property"]}' for callback in self.callbacks
+                  for item in callback['inputs'] + callback['state']}
+        for callback in self.callbacks:
+            callback['name'] = '+'.join(output_props(callback['output']))
+            callback['triggers'] = {f'{item["id"]}.{item["property"]}' for item in callback['inputs']}
+            # Only responses feeding other callbacks are decoded
+            callback['feeds'] = bool(inputs.intersection(output_props(callback['output'])))
+        self.initial = {key: self.props.get(key.split('.')[0], {}).get(key.split('.')[1]) for key in inputs}
+        self.filters = {component: weight for component, weight in INTERACTIONS.items()
+                        if component in self.props and 'options' in self.props[component]}
+
+    def load_page(self, session, record):
+        # Fetch the page and its layout like a browser, returning the initial values to change
+        for name, path in (('page', ''), ('layout', '_dash-layout')):
+            started = time.perf_counter()
+            try:
+                ok = session.get(f'{self.url}{path}', timeout=self.timeout).ok
+            except requests.RequestException:
+                ok = False
+            record(name, started, ok)
+        return dict(self.initial)
+
+    def interact(self, values, rng):
+        # Change one filter at random: toggle an option of a checklist, or pick or clear a dropdown
+        component = rng.choices(list(self.filters), weights=list(self.filters.values()))[0]
+        key = f'{component}.value'
+        options = option_values(self.props[component]['options'])
+        current = values.get(key)
+        if isinstance(self.props[component].get('value'), list) or isinstance(current, list):
+            toggled = rng.choice(options)
+            selected = set(current or [])
+            selected ^= {toggled}
+            values[key] = [option for option in options if option in selected]
+        else:
+            values[key] = rng.choice([option for option in options + [None] if option != current])
+        return key
+
+    def fire(self, browser, session, values, changed, record):
+        # Call every callback the changed values trigger (on page load, every one that runs
+        # initially) together, then the callbacks triggered by their outputs, as the renderer does
+        if changed is None:
+            pending = [callback for callback in self.callbacks if not callback['prevent_initial_call']]
+        else:
+            pending = [callback for callback in self.callbacks if changed & callback['triggers']]
+        requested = 0
+        for _ in range(MAX_CHAIN):
+            if not pending:
+                break
+            triggered = changed or set()
+            updates = {}
+            for update in browser.map(lambda callback: self.call(session, callback, values, triggered, record), pending):
+                updates.update(update)
+            values.update(updates)
+            requested += len(pending)
+            changed = set(updates)
+            pending = [callback for callback in self.callbacks if changed & callback['triggers']]
+        return requested
+
+    def call(self, session, callback, values, changed, record):
+        # POST one callback with the current values, returning the new values of the inputs it set
+        outputs = [{'id': component, 'property': prop} for component, prop in output_specs(callback['output'])]
+        body = {
+            'output': callback['output'],
+            'outputs': outputs if callback['output'].startswith('..') else outputs[0],
+            'inputs': [dict(item, value=values.get(f'{item["id"]}.{item["property"]}')) for item in callback['inputs']],
+            'changedPropIds': sorted(changed & callback['triggers']),
+            'state': [dict(item, value=values.get(f'{item["id"]}.{item["property"]}')) for item in callback['state']],
+        }
+        started = time.perf_counter()
+        try:
+            response = session.post(f'{self.url}_dash-update-component', json=body, timeout=self.timeout)
+            # 204 is a callback that prevented the update
+            ok = response.status_code in (200, 204)
+        except requests.RequestException:
+            response, ok = None, False
+        record(callback['name'], started, ok)
+        if not ok or response.status_code == 204 or not callback['feeds']:
+            return {}
+
+        updated = {}
+        for component, props in response.json()['response'].items():
+            for prop, value in props.items():
+                if f'{component}.{prop}' in self.initial:
+                    updated[f'{component}.{prop}'] = value
+        return updated
+
+
+def simulate_user(dashboard, deadline, session_length, think_time, rng, record):
+    # Load the page, then change session_length filters one after another, pausing for an
+    # exponentially distributed think time between them; then reload, until the deadline
+    session = requests.Session()
+    browser = ThreadPoolExecutor(BROWSER_CONNECTIONS)
+    while time.perf_counter() < deadline:
+        values = dashboard.load_page(session, record)
+        dashboard.fire(browser, session, values, None, record)
+        for _ in range(session_length):
+            if think_time:
+                time.sleep(rng.expovariate(1 / think_time))
+            if time.perf_counter() >= deadline:
+                return
+            changed = dashboard.interact(values, rng)
+            started = time.perf_counter()
+            if dashboard.fire(browser, session, values, {changed}, record):
+                record('interaction', started, True)
+
+
+def run(url, users, duration, warmup, session_length, think_time, timeout, seed):
+    # Run the simulated users concurrently and summarise what completed after the warm-up
+    dashboard = Dashboard(url, timeout)
+    samples = []
+    started = time.perf_counter()
+    measured_from = started + warmup
+    deadline = measured_from + duration
+
+    def record(name, request_started, ok):
+        finished = time.perf_counter()
+        if request_started >= measured_from and finished <= deadline:
+            samples.append((name, finished - request_started, ok))
+
+    threads = [threading.Thread(target=simulate_user, daemon=True,
+                                args=(dashboard, deadline, session_length, think_time, random.Random(seed + user), record))
+               for user in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    requests_made = [sample for sample in samples if sample[0] != 'interaction']
+    errors = sum(not ok for name, latency, ok in requests_made)
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'url': url,
+            'users': users,
+            'duration_s': duration,
+            'warmup_s': warmup,
+            'session_length': session_length,
+            'think_time_s': think_time,
+            'seed': seed,
+            'cpus': os.cpu_count(),
+        },
+        'requests': len(requests_made),
+        'errors': errors,
+        'error_rate': errors / len(requests_made) if requests_made else 0.0,
+        'throughput_rps': len(requests_made) / duration,
+        'latency': latency_summary([latency for name, latency, ok in requests_made if ok]),
+        'interactions': latency_summary([latency for name, latency, ok in samples if name == 'interaction']),
+        'endpoints': [],
+    }
+    for name in sorted({sample[0] for sample in requests_made}):
+        endpoint = [sample for sample in requests_made if sample[0] == name]
+        report['endpoints'].append(dict(name=name, errors=sum(not ok for _, _, ok in endpoint),
+                                        **latency_summary([latency for _, latency, ok in endpoint if ok])))
+    return report
+
+
+def latency_summary(latencies):
+    return summarise(latencies) if latencies else {'calls': 0}
+
+
+def start_server(app_name, bind, path, workers, threads, timeout):
+    # Serve a dashboard with serve.py in a child process, returning it once its layout is served
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get('PYTHONPATH')])))
+    process = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, 'serve.py'), app_name, '--bind', bind,
+                                '--workers', str(workers), '--threads', str(threads)], env=env)
+    url = f'http://{bind}{path}'
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if process.poll() is not None:
+            sys.exit(f'{app_name} exited with status {process.returncode}')
+        try:
+            if requests.get(f'{url}_dash-layout', timeout=1).ok:
+                return process, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    sys.exit(f'{app_name} did not start within {timeout}s')
+
+
+def print_report(report):
+    latency = report['latency']
+    print(f'{report["requests"]} requests from {report["meta"]["users"]} users in {report["meta"]["duration_s"]}s: '
+          f'{report["throughput_rps"]:.1f} requests/s, {report["error_rate"]:.2%} errors', file=sys.stderr)
+    for name, summary in [('all requests', latency), ('interactions', report['interactions'])] + \
+                         [(endpoint['name'], endpoint) for endpoint in report['endpoints']]:
+        if summary['calls']:
+            print(f'{name[:60]:60} {summary["calls"]:7d}  p50 {summary["p50_ms"]:8.1f}  p95 {summary["p95_ms"]:8.1f}  '
+                  f'p99 {summary["p99_ms"]:8.1f} ms', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load-test a dashboard with concurrent simulated users posting '
+                                                 'filter changes to its Dash callbacks.')
+    parser.add_argument('app', nargs='?', choices=['good_visualization', 'bad_visualization', 'dashboards'],
+                        default='good_visualization', help='dashboard started with serve.py')
+    parser.add_argument('--url', help='test a dashboard already served here instead, e.g. http://127.0.0.1:8050/')
+    parser.add_argument('--path', default='/', help='URL prefix of the dashboard, e.g. /good/ for dashboards')
+    parser.add_argument('--bind', default='127.0.0.1:8051')
+    parser.add_argument('--workers', type=int, default=settings.WORKERS)
+    parser.add_argument('--threads', type=int, default=settings.THREADS)
+    parser.add_argument('--users', type=int, default=50, help='concurrent simulated users')
+    parser.add_argument('--duration', type=float, default=30, help='seconds measured')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds run before measuring')
+    parser.add_argument('--session-length', type=int, default=10, help='filter changes before a user reloads the page')
+    parser.add_argument('--think-time', type=float, default=1.0, help='mean seconds between filter changes; 0 for none')
+    parser.add_argument('--timeout', type=float, default=30, help='seconds before a request counts as failed')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        url = args.url if args.url.endswith('/') else f'{args.url}/'
+    else:
+        server, url = start_server(args.app, args.bind, args.path, args.workers, args.threads, timeout=120)
+    try:
+        report = run(url, args.users, args.duration, args.warmup, args.session_length, args.think_time,
+                     args.timeout, args.seed)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,124 @@
+import argparse
+import gzip
+import hashlib
+import importlib
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import settings
+from benchmark import CALLBACKS
+from app_data import AGE_BIN_WIDTH
+from dataset import state_abbrev
+from figure_cache import blob_path, cache_key, function_name
+
+# Outputs every dashboard looks up besides its charts' figures
+EXTRA_OUTPUTS = ['season_options', 'client_cells', 'chart_cells']
+
+# Dashboard imported by each worker process
+module = None
+
+
+def subsets(values):
+    return [list(subset) for size in range(len(values), -1, -1) for subset in itertools.combinations(values, size)]
+
+
+def filter_choices(seasons):
+    # Every value each kind of filter can take, up to order, which the figure cache ignores
+    return {
+        'seasons': subsets(seasons),
+        'state': [None] + sorted(state_abbrev.values()),
+        'genders': subsets(['Male', 'Female']),
+        'overall_genders': subsets(['Male', 'Female', 'Overall']),
+        # Only the default age groups, whose controls are disabled when serving the bundle
+        'bin_width': [AGE_BIN_WIDTH],
+        'age_edges': [None],
+    }
+
+
+def calls(app_name, seasons):
+    choices = filter_choices(seasons)
+    for name in EXTRA_OUTPUTS:
+        yield name, ()
+    for name, inputs in CALLBACKS[app_name].items():
+        for args in itertools.product(*(choices[kind] for kind in inputs)):
+            yield name, args
+
+
+def store(bundle, value):
+    # Write an output once under the hash of its JSON, returning the hash
+    from plotly.io.json import to_json_plotly
+    content = to_json_plotly(value).encode()
+    digest = hashlib.sha256(content).hexdigest()
+    path = blob_path(bundle, digest)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written aside and renamed, as another worker may be storing the same output
+        building = f'{path}.{os.getpid()}.tmp'
+        with open(building, 'wb') as file:
+            file.write(gzip.compress(content, mtime=0))
+        os.replace(building, path)
+    return digest
+
+
+def start_worker(app_name):
+    global module
+    module = importlib.import_module(app_name)
+    module.warm_up()
+
+
+def render(task):
+    bundle, name, args = task
+    func = getattr(module, name)
+    value = func(*args)
+    if isinstance(value, tuple):
+        entry = [store(bundle, part) for part in value]
+    else:
+        entry = store(bundle, value)
+    return repr(cache_key(function_name(func), args)), entry
+
+
+def build(apps, bundle, processes):
+    # Render every output of every dashboard for every filter combination. Workers are forked
+    # after the data is loaded, so they share it instead of each reading the CSV.
+    outputs = {}
+    for app_name in apps:
+        started = time.perf_counter()
+        start_worker(app_name)
+        # A refresh in progress would hold its lock in the forked workers
+        module.data.refresher.halt()
+        tasks = [(bundle, name, args) for name, args in calls(app_name, module.season_options())]
+        with multiprocessing.Pool(processes, initializer=start_worker, initargs=(app_name,)) as pool:
+            outputs.update(pool.imap_unordered(render, tasks, chunksize=16))
+        print(f'{app_name}: rendered {len(tasks)} outputs in {time.perf_counter() - started:.1f}s', file=sys.stderr)
+
+    index = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'apps': list(apps),
+        'data_version': module.data.cube.version,
+        'outputs': outputs,
+    }
+    building = os.path.join(bundle, 'index.json.tmp')
+    with open(building, 'w') as file:
+        json.dump(index, file)
+    os.replace(building, os.path.join(bundle, 'index.json'))
+
+    figures = os.path.join(bundle, 'figures')
+    files = [os.path.join(directory, name) for directory, _, names in os.walk(figures) for name in names]
+    size_mb = sum(os.path.getsize(path) for path in files) / 2 ** 20
+    print(f'{len(outputs)} outputs stored as {len(files)} distinct files, {size_mb:.1f} MB', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pre-render every dashboard figure into a bundle '
+                                                 'that PRERENDERED_BUNDLE serves without the data.')
+    parser.add_argument('output', help='bundle directory to write')
+    parser.add_argument('--apps', nargs='+', choices=list(CALLBACKS), default=list(CALLBACKS))
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    if settings.PRERENDERED_BUNDLE:
+        sys.exit('Unset PRERENDERED_BUNDLE to render a bundle from the data')
+    build(args.apps, args.output, args.processes)
@@ -0,0 +1,238 @@
+import functools
+import hashlib
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+from cube import AGE_AXES, AGE_MEASURE, DIMENSIONS, MEASURES, AgeHistogram, count_column, finish_rollup, rollup_columns
+from dataset import bins, labels, state_abbrev
+from figure_cache import canonical
+from instrumentation import phase
+from shared_cache import shared_cache
+
+# Table the SQLite backend copies the raw transactions into
+SQLITE_TABLE = 'transactions'
+
+
+def quote(column):
+    return '"' + column.replace('"', '""') + '"'
+
+
+def literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def derived_columns():
+    # The 'state_abbr' and 'Age Group' columns of dataset.prepare, computed by the engine
+    states = ' '.join(f'WHEN {literal(name)} THEN {literal(abbr)}' for name, abbr in state_abbrev.items())
+    ages = ' '.join(f'WHEN "Age" >= {low} AND "Age" < {high} THEN {literal(label)}'
+                    for low, high, label in zip(bins, bins[1:], labels))
+    return f'CASE "Location" {states} END AS state_abbr, CASE {ages} END AS "Age Group"'
+
+
+def summed(column):
+    # Count columns of the pandas cube are non-null counts of the raw measure
+    for measure in MEASURES:
+        if column == count_column(measure):
+            return f'COUNT({quote(measure)})'
+    return f'SUM({quote(column)})'
+
+
+class Engine:
+    # An embedded database over the transactions in a source file, with one connection per
+    # thread and process
+
+    def __init__(self, source, path):
+        self.source = source
+        self.path = path
+        self.stamp = file_stamp(source)
+        self.local = threading.local()
+
+    def connection(self):
+        if getattr(self.local, 'pid', None) != os.getpid():
+            self.local.connection, self.local.pid = self.connect(), os.getpid()
+        return self.local.connection
+
+    def relation(self):
+        # Only the raw columns the cube is built from, plus the derived ones
+        columns = [column for column in DIMENSIONS if column not in ('state_abbr', 'Age Group')] + ['Age'] + MEASURES
+        return f'(SELECT {", ".join(map(quote, columns))}, {derived_columns()} FROM {self.table()}) AS transactions'
+
+    def query(self, sql, parameters=()):
+        cursor = self.connection().execute(sql, list(parameters))
+        return pd.DataFrame(cursor.fetchall(), columns=[column[0] for column in cursor.description])
+
+
+class DuckDBEngine(Engine):
+    # Queries the CSV (or a Parquet file) in place with DuckDB's multi-threaded vectorised scans
+    name = 'duckdb'
+    # Position of a row in the file
+    position = 'row_number() OVER ()'
+
+    def __init__(self, source):
+        super().__init__(source, source)
+
+    def connect(self):
+        import duckdb
+        return duckdb.connect()
+
+    def table(self):
+        reader = 'read_parquet' if self.path.endswith('.parquet') else 'read_csv'
+        return f'{reader}({literal(self.path)})'
+
+
+class SQLiteEngine(Engine):
+    # Copies the CSV into a SQLite file once, indexed on the filter columns, and queries that
+    name = 'sqlite'
+    position = 'rowid'
+
+    def __init__(self, source):
+        path = os.path.splitext(source)[0] + '.sqlite'
+        ingest_sqlite(source, path)
+        super().__init__(source, path)
+
+    def connect(self):
+        return sqlite3.connect(self.path, check_same_thread=False)
+
+    def table(self):
+        return SQLITE_TABLE
+
+
+def file_stamp(path):
+    status = os.stat(path)
+    return path, status.st_size, status.st_mtime_ns
+
+
+def ingest_sqlite(csv_path, database_path, chunksize=100_000):
+    # (Re)build the SQLite copy when it is missing or older than the CSV
+    if os.path.exists(database_path) and os.path.getmtime(database_path) >= os.path.getmtime(csv_path):
+        return
+    # Built aside under this thread's own name and renamed, as other workers may be rebuilding
+    # the same copy at the same time
+    building = f'{database_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    if os.path.exists(building):
+        os.remove(building)
+    try:
+        with sqlite3.connect(building) as connection:
+            for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+                chunk.to_sql(SQLITE_TABLE, connection, if_exists='append', index=False)
+            for column in ('Season', 'Location', 'Gender'):
+                connection.execute(f'CREATE INDEX {quote(column + " index")} ON {SQLITE_TABLE} ({quote(column)})')
+        connection.close()
+        os.replace(building, database_path)
+    except BaseException:
+        if os.path.exists(building):
+            os.remove(building)
+        raise
+
+
+class QueryCube:
+    # The Cube interface answered with parameterised GROUP BY queries against an embedded
+    # engine, so the transactions are scanned where they are stored instead of held in memory.
+    # A subset only narrows the WHERE clause of later queries.
+
+    def __init__(self, engine, filters=(), origin=None):
+        self.engine = engine
+        self.filters = filters
+        self.origin = origin
+
+    @functools.cached_property
+    def version(self):
+        # The source file's path, size and modification time name this dataset in shared caches
+        if self.origin is not None:
+            parent, filters = self.origin
+            return hashlib.sha256(repr((parent.version,) + filters).encode()).hexdigest()
+        return hashlib.sha256(repr(self.engine.stamp).encode()).hexdigest()
+
+    @functools.cached_property
+    def season_order(self):
+        # Seasons in order of first appearance, like the pandas cube
+        return self.engine.query(
+            f'SELECT "Season" FROM (SELECT "Season", {self.engine.position} AS position FROM {self.engine.table()}) '
+            f'GROUP BY "Season" ORDER BY MIN(position)'
+        )['Season'].tolist()
+
+    def seasons(self):
+        return list(self.season_order)
+
+    @functools.cached_property
+    def age_histogram(self):
+        # Queried once per source; a subset filters its parent's, like the pandas cube
+        if self.origin is not None:
+            parent, filters = self.origin
+            return parent.age_histogram.subset(*filters)
+        axes = ', '.join(quote(axis) for axis in AGE_AXES)
+        return AgeHistogram.from_cells(self.engine.query(
+            f'SELECT {axes}, COALESCE(SUM({quote(AGE_MEASURE)}), 0) AS {quote(AGE_MEASURE)}, '
+            f'COUNT({quote(AGE_MEASURE)}) AS {quote(count_column(AGE_MEASURE))} '
+            f'FROM {self.engine.relation()} GROUP BY {axes}'
+        ))
+
+    def warm(self):
+        self.season_order
+        self.age_histogram
+
+    def reopen(self):
+        # A cube over the current contents of the source, or None when it has not changed
+        if file_stamp(self.engine.source) == self.engine.stamp:
+            return None
+        return open_query_cube(self.engine.source, self.engine.name)
+
+    def subset(self, seasons=None, state=None, genders=None):
+        if seasons is None and not state and genders is None:
+            return self
+        filters = (canonical(seasons), state or None, canonical(genders))
+        return QueryCube(self.engine, self.filters + (filters,), origin=(self, filters))
+
+    def where(self, by, dropna=True):
+        # Conditions and parameters of every filter applied so far; rows without a group are
+        # dropped, as in a pandas groupby, unless dropna is False
+        conditions = [f'{quote(column)} IS NOT NULL' for column in by] if dropna else []
+        parameters = []
+        for seasons, state, genders in self.filters:
+            for column, values in (('Season', seasons), ('Gender', genders)):
+                if values is None:
+                    continue
+                if not values:
+                    conditions.append('1 = 0')
+                    continue
+                conditions.append(f'{quote(column)} IN ({", ".join("?" * len(values))})')
+                parameters.extend(values)
+            if state:
+                conditions.append('state_abbr = ?')
+                parameters.append(state)
+        return ' AND '.join(conditions) or '1 = 1', parameters
+
+    @shared_cache.memoize
+    def rollup(self, by, seasons=None, state=None, genders=None, mean=(), total=(), dropna=True):
+        cube = self.subset(seasons, state, genders)
+        columns = rollup_columns(mean, total)
+        groups = ', '.join(quote(column) for column in by)
+        conditions, parameters = cube.where(by, dropna)
+        sql = (f'SELECT {groups}, {", ".join(f"{summed(column)} AS {quote(column)}" for column in columns)} '
+               f'FROM {self.engine.relation()} WHERE {conditions} GROUP BY {groups} ORDER BY {groups}')
+
+        with phase('aggregate'):
+            sums = self.engine.query(sql, parameters)
+
+        # Sums stay numeric even without rows, and group columns come back as categoricals, with
+        # every age group in order, like the pandas cube
+        for column in columns:
+            sums[column] = pd.to_numeric(sums[column])
+        for column in by:
+            if column == 'Age Group':
+                sums[column] = pd.Categorical(sums[column], categories=labels, ordered=True)
+            else:
+                sums[column] = sums[column].astype('category')
+        return finish_rollup(sums.set_index(list(by)), mean, total)
+
+
+ENGINES = {engine.name: engine for engine in (DuckDBEngine, SQLiteEngine)}
+
+
+def open_query_cube(source, backend):
+    if backend not in ENGINES:
+        raise ValueError(f'Unsupported QUERY_BACKEND: {backend}')
+    return QueryCube(ENGINES[backend](source))
@@ -0,0 +1,105 @@
+import glob
+import logging
+import os
+import threading
+
+from cube import Cube, combine
+from dataset import CSV_PATH, complete_size, load_cube, read_appended, stream_aggregate
+from figure_cache import figure_cache
+from settings import AGGREGATE_WORKERS, BATCH_DIR, QUERY_BACKEND, STREAM_CHUNKSIZE
+
+logger = logging.getLogger(__name__)
+
+
+class Refresher:
+    # Loads the cube, then folds rows appended to the CSV and new batch files into it, so the
+    # dashboards stay current without a restart or a full re-parse
+
+    def __init__(self, csv_path=CSV_PATH, batch_dir=BATCH_DIR):
+        self.csv_path = csv_path
+        self.batch_dir = batch_dir
+        self.seen = set()
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.thread = None
+
+        # A query backend tracks its own source, which need not be the CSV (QUERY_SOURCE), so the
+        # CSV may not exist then
+        self.offset = None
+        self.cube = self.load() if QUERY_BACKEND == 'pandas' else load_cube(csv_path)
+        self.refresh()
+
+    def load(self, workers=AGGREGATE_WORKERS):
+        # Load the complete lines the CSV has now and remember where they end, so rows appended
+        # during the load, and a line still being written, are folded in once by a later refresh
+        self.offset = complete_size(self.csv_path)
+        return load_cube(self.csv_path, workers=workers, size=self.offset)
+
+    def new_batches(self):
+        if not self.batch_dir:
+            return []
+        return sorted(path for path in glob.glob(os.path.join(self.batch_dir, '*.csv')) if path not in self.seen)
+
+    def refresh(self):
+        # Swap in a cube covering new data; returns whether anything changed
+        with self.lock:
+            # A query backend reads its source directly and only needs reopening once it changed
+            cube = self.fold() if isinstance(self.cube, Cube) else self.cube.reopen()
+            if cube is None:
+                return False
+
+            # Build the new cube's lookups before swapping it in
+            cube.warm()
+            self.cube = cube
+
+        figure_cache.clear()
+        for listener in self.listeners:
+            listener(cube)
+        return True
+
+    def fold(self):
+        # Aggregate only the delta and merge it into a new cube, or None when nothing changed. This
+        # runs on the refresh thread next to request threads, so it aggregates in this process
+        # rather than forking workers.
+        cubes = []
+        if os.path.getsize(self.csv_path) < self.offset:
+            # The CSV was rewritten rather than appended to: start over
+            cubes.append(self.load(workers=1))
+            self.seen.clear()
+        else:
+            cubes.append(self.cube)
+            appended, self.offset = read_appended(self.csv_path, self.offset)
+            if appended is not None:
+                cubes.append(stream_aggregate(appended, STREAM_CHUNKSIZE, workers=1))
+
+        for path in self.new_batches():
+            cubes.append(stream_aggregate(path, STREAM_CHUNKSIZE, workers=1))
+            self.seen.add(path)
+
+        if len(cubes) == 1 and cubes[0] is self.cube:
+            return None
+        return combine(cubes)
+
+    def run(self, interval):
+        while not self.stop.wait(interval):
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception('Refreshing the shopping trends data failed')
+
+    def start(self, interval):
+        # Poll for new data in a background thread. Threads do not survive a fork, so each
+        # forked worker calls this again to poll in its own process.
+        if interval <= 0 or (self.thread is not None and self.thread.is_alive()):
+            return
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run, args=(interval,), daemon=True)
+        self.thread.start()
+
+    def halt(self):
+        # Stop polling and wait for a refresh in progress, so the lock is free before forking
+        self.stop.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+
+from dataset import CSV_PATH, state_abbrev
+from figure_cache import canonical
+from settings import QUERY_BACKEND, QUERY_SOURCE, SAMPLE_ERROR_THRESHOLD, SAMPLE_PER_STRATUM, STREAM_CHUNKSIZE
+
+# Every state is sampled in every season, so small states still appear in estimates
+STRATA = ['state_abbr', 'Season']
+SAMPLE_COLUMNS = ['Season', 'Location', 'Item Purchased', 'Category', 'Gender', 'Review Rating']
+
+# Any fixed seed, so every worker draws the same sample; one other than synthetic_data's default,
+# whose random stream would otherwise line up with the generated rows
+SAMPLE_SEED = 1729
+
+# Normal quantile of a two-sided 95% confidence interval
+Z_95 = 1.959964
+
+
+def sample_source():
+    # The file the cube is built from: a query backend reads QUERY_SOURCE when one is set
+    if QUERY_BACKEND != 'pandas':
+        return QUERY_SOURCE or CSV_PATH
+    return CSV_PATH
+
+
+def read_chunks(source, chunksize):
+    # The sampled columns of a CSV or Parquet file, a chunk at a time
+    if not source.endswith('.parquet'):
+        yield from pd.read_csv(source, usecols=SAMPLE_COLUMNS, chunksize=chunksize)
+        return
+    import pyarrow.parquet as pq
+    for batch in pq.ParquetFile(source).iter_batches(batch_size=chunksize, columns=SAMPLE_COLUMNS):
+        chunk = batch.to_pandas()
+        # Plain values as read from a CSV, as the categories of separate batches may differ
+        for column in chunk.columns:
+            if isinstance(chunk[column].dtype, pd.CategoricalDtype):
+                chunk[column] = chunk[column].astype(chunk[column].cat.categories.dtype)
+        yield chunk
+
+
+def draw_sample(source=None, per_stratum=SAMPLE_PER_STRATUM, seed=SAMPLE_SEED, chunksize=STREAM_CHUNKSIZE):
+    # Keep the rows with the smallest random keys per stratum, a uniform sample that can be
+    # merged chunk by chunk, and count every stratum's rows to weight the sampled ones
+    rng = np.random.default_rng(seed)
+    kept = None
+    sizes = None
+    for chunk in read_chunks(source or sample_source(), chunksize or 1_000_000):
+        chunk['state_abbr'] = chunk['Location'].map(state_abbrev)
+        chunk['key'] = rng.random(len(chunk))
+        counts = chunk.groupby(STRATA).size()
+        sizes = counts if sizes is None else sizes.add(counts, fill_value=0)
+        pool = chunk if kept is None else pd.concat([kept, chunk], ignore_index=True)
+        kept = pool.sort_values('key').groupby(STRATA, sort=False).head(per_stratum)
+
+    sampled = kept.groupby(STRATA).size()
+    weights = (sizes / sampled).rename('weight')
+    frame = kept.drop(columns='key').join(weights, on=STRATA).reset_index(drop=True)
+    for column in SAMPLE_COLUMNS[:-1] + ['state_abbr']:
+        frame[column] = frame[column].astype('category')
+    return Sample(frame)
+
+
+class Sample:
+    # Weighted rows of a stratified sample, rolled up like a cube into estimated means with
+    # confidence intervals. Each row stands for `weight` rows of its stratum.
+
+    def __init__(self, frame):
+        self.frame = frame
+
+    def subset(self, seasons=None, state=None, genders=None):
+        # Filters on whole strata (season, state) keep the estimates unbiased
+        frame = self.frame
+        if seasons is not None:
+            frame = frame[frame['Season'].isin(canonical(seasons))]
+        if state:
+            frame = frame[frame['state_abbr'] == state]
+        if genders is not None:
+            frame = frame[frame['Gender'].isin(canonical(genders))]
+        return Sample(frame)
+
+    def rollup(self, by, mean=(), total=()):
+        # Weighted means, each with the half-width of its 95% confidence interval in '<measure> ci',
+        # and estimated totals
+        result = None
+        for measure in list(mean) + [measure for measure in total if measure not in mean]:
+            rows = self.frame.dropna(subset=[measure])
+            weight = rows['weight'].to_numpy()
+            value = rows[measure].to_numpy()
+            sums = rows[list(by)].assign(
+                n=1, w=weight, w2=weight ** 2, wy=weight * value, wy2=weight * value ** 2
+            ).groupby(list(by), observed=True).sum()
+            n, w, w2, wy, wy2 = (sums[column].to_numpy() for column in ('n', 'w', 'w2', 'wy', 'wy2'))
+
+            estimate = pd.DataFrame(index=sums.index)
+            if measure in total:
+                estimate[measure] = wy
+            if measure in mean:
+                average = wy / w
+                # Variance with reliability weights, over the Kish effective sample size and
+                # shrunk by the unsampled share of the group's rows
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    variance = (wy2 - w * average ** 2) / (w - w2 / w)
+                    unsampled = np.clip(1 - n / w, 0, None)
+                    ci = Z_95 * np.sqrt(np.clip(variance, 0, None) / (w ** 2 / w2) * unsampled)
+                estimate[measure] = average
+                estimate[f'{measure} ci'] = np.where(unsampled > 0, ci, 0.0)
+            result = estimate if result is None else result.join(estimate, how='outer')
+        return result.reset_index()
+
+    def accurate(self, by, measure='Review Rating', threshold=SAMPLE_ERROR_THRESHOLD):
+        # Whether every estimated mean is within the threshold of the exact one, at 95% confidence
+        ci = self.rollup(by, mean=[measure])[f'{measure} ci']
+        return bool((ci <= threshold).all())
@@ -0,0 +1,67 @@
+import argparse
+import gc
+import importlib
+import sys
+
+import settings
+from instrumentation import startup_report, timed
+
+
+def preload(app_name):
+    # Import and warm up a dashboard in the master process, so the aggregates, the filter index
+    # and the plotting libraries are loaded once and every forked worker shares those pages
+    # copy-on-write
+    with timed('import app'):
+        module = importlib.import_module(app_name)
+    module.warm_up()
+    print(f'{app_name} loaded: {startup_report()}', file=sys.stderr)
+    # Refreshing restarts in each worker after the fork
+    if module.data.refresher is not None:
+        module.data.refresher.halt()
+    # Move the loaded objects out of the collector's reach, so collections in the workers do
+    # not write to (and thereby copy) the shared pages
+    gc.collect()
+    gc.freeze()
+    return module
+
+
+def serve(app_name, bind, workers, threads):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        sys.exit('serve.py needs gunicorn (pip install gunicorn), which runs on Unix only; '
+                 f'use `python {app_name}.py` for the development server')
+
+    module = preload(app_name)
+
+    def post_fork(server, worker):
+        if module.data.refresher is not None:
+            module.data.refresher.start(settings.REFRESH_INTERVAL)
+
+    class Server(BaseApplication):
+
+        def load_config(self):
+            config = {
+                'bind': bind,
+                'workers': workers,
+                'threads': threads,
+                'preload_app': True,
+                'post_fork': post_fork,
+            }
+            for key, value in config.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return module.server
+
+    Server().run()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve a dashboard with preloaded data shared by forked workers.')
+    parser.add_argument('app', nargs='?', choices=['good_visualization', 'bad_visualization', 'dashboards'], default='good_visualization')
+    parser.add_argument('--bind', default=settings.BIND)
+    parser.add_argument('--workers', type=int, default=settings.WORKERS)
+    parser.add_argument('--threads', type=int, default=settings.THREADS)
+    args = parser.parse_args()
+    serve(args.app, args.bind, args.workers, args.threads)
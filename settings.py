@@ -0,0 +1,65 @@
+import os
+
+
+def flag(name, default=False):
+    return os.environ.get(name, '1' if default else '0').strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# Rows per chunk when streaming the CSV into aggregates; 0 loads the whole dataset at once
+STREAM_CHUNKSIZE = int(os.environ.get('STREAM_CHUNKSIZE', 0))
+
+# Processes aggregating the rows in parallel: the rows of each state when loading the whole
+# dataset, consecutive chunks when streaming; 0 or 1 aggregates in this process
+AGGREGATE_WORKERS = int(os.environ.get('AGGREGATE_WORKERS', 0))
+
+# Where roll-ups are computed: 'pandas' (in-memory aggregates), or GROUP BY queries with 'duckdb'
+# (over QUERY_SOURCE, the CSV by default, or a Parquet file) or 'sqlite' (over a copy of the CSV)
+QUERY_BACKEND = os.environ.get('QUERY_BACKEND', 'pandas')
+QUERY_SOURCE = os.environ.get('QUERY_SOURCE', '')
+
+# Maximum number of figures kept per process; 0 disables caching
+FIGURE_CACHE_SIZE = int(os.environ.get('FIGURE_CACHE_SIZE', 256))
+
+# Directory of figures pre-rendered by prerender.py to answer callbacks from, without reading the data.
+# Figures are looked up per chart, so coalesced callbacks and progressive rendering are turned off.
+PRERENDERED_BUNDLE = os.environ.get('PRERENDERED_BUNDLE', '')
+
+# Serve all charts from one multi-output callback, so a filter change is one request and one filter pass
+COALESCE_CALLBACKS = flag('COALESCE_CALLBACKS') and not PRERENDERED_BUNDLE
+
+# Ship the age/gender cells and the per season, state and item cells to the browser once and redraw
+# every chart in clientside callbacks, so filter changes need no server round trip
+CLIENTSIDE_FILTERING = flag('CLIENTSIDE_FILTERING')
+
+# Seconds between checks for rows appended to the CSV or new batch files; 0 disables refreshing
+REFRESH_INTERVAL = float(os.environ.get('REFRESH_INTERVAL', 0))
+
+# Directory of additional CSV batch files folded into the aggregates as they appear
+BATCH_DIR = os.environ.get('BATCH_DIR', '')
+
+# Record per-phase callback timings and serve them on /metrics
+INSTRUMENT_CALLBACKS = flag('INSTRUMENT_CALLBACKS')
+
+# After the initial render, send only traces and changed layout properties (Dash Patch)
+PARTIAL_UPDATES = flag('PARTIAL_UPDATES')
+
+# Compress responses (requires flask-compress)
+COMPRESS_RESPONSES = flag('COMPRESS_RESPONSES')
+
+# Draw the map and bar chart from a stratified sample first, then exactly when an estimate is
+# less accurate than the threshold (half-width of its 95% confidence interval, in rating points)
+PROGRESSIVE_RENDERING = flag('PROGRESSIVE_RENDERING') and not PRERENDERED_BUNDLE and not CLIENTSIDE_FILTERING
+SAMPLE_PER_STRATUM = int(os.environ.get('SAMPLE_PER_STRATUM', 500))
+SAMPLE_ERROR_THRESHOLD = float(os.environ.get('SAMPLE_ERROR_THRESHOLD', 0.05))
+
+# Aggregates shared between processes: '' (off), sqlite:///path/to/cache.db, redis://host:port/db or memory://
+SHARED_CACHE_URL = os.environ.get('SHARED_CACHE_URL', '')
+
+# Seconds a shared aggregate is kept, and the maximum number of aggregates kept
+SHARED_CACHE_TTL = float(os.environ.get('SHARED_CACHE_TTL', 3600))
+SHARED_CACHE_SIZE = int(os.environ.get('SHARED_CACHE_SIZE', 10_000))
+
+# Production server (serve.py): address, worker processes sharing the preloaded data, and threads per worker
+BIND = os.environ.get('BIND', '0.0.0.0:8050')
+WORKERS = int(os.environ.get('WORKERS', os.cpu_count() or 1))
+THREADS = int(os.environ.get('THREADS', 4))
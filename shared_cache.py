@@ -0,0 +1,217 @@
+import functools
+import hashlib
+import inspect
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from instrumentation import record_cache
+from settings import SHARED_CACHE_SIZE, SHARED_CACHE_TTL, SHARED_CACHE_URL
+
+logger = logging.getLogger(__name__)
+
+
+def freeze(value):
+    # Lists become tuples so arguments have a stable repr for the key
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def encode(frame):
+    # Roll-ups are stored as an Arrow IPC stream, which holds only data, so an entry written to a
+    # shared store cannot run code in the processes reading it, unlike a pickle. The pandas
+    # metadata keeps the index, and dictionaries keep every category, ordered age groups included.
+    import pyarrow as pa
+    # One record batch even without rows, as an empty table writes none and would lose the categories
+    batch = pa.RecordBatch.from_pandas(frame)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def decode(value):
+    import pyarrow as pa
+    return pa.ipc.open_stream(value).read_all().to_pandas()
+
+
+class SQLiteBackend:
+    # Entries in a SQLite file on local disk, shared by every process on the machine
+
+    def __init__(self, path, ttl=SHARED_CACHE_TTL, maxsize=SHARED_CACHE_SIZE):
+        self.path = path
+        self.ttl = ttl
+        self.maxsize = maxsize
+        # sqlite3 connections must not cross threads or forks, so each thread of each process opens its own
+        self.local = threading.local()
+
+    def connection(self):
+        if getattr(self.local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS entries '
+                               '(key TEXT PRIMARY KEY, value BLOB, expires REAL, used REAL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS entries_used ON entries (used)')
+            self.local.connection, self.local.pid = connection, os.getpid()
+        return self.local.connection
+
+    def get(self, key):
+        connection = self.connection()
+        now = time.time()
+        row = connection.execute('SELECT value FROM entries WHERE key = ? AND expires > ?', (key, now)).fetchone()
+        if row is None:
+            return None
+        connection.execute('UPDATE entries SET used = ? WHERE key = ?', (now, key))
+        return row[0]
+
+    def set(self, key, value):
+        connection = self.connection()
+        now = time.time()
+        connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)', (key, value, now + self.ttl, now))
+        # Drop expired entries, then the least recently used ones past the size bound
+        connection.execute('DELETE FROM entries WHERE expires <= ?', (now,))
+        connection.execute('DELETE FROM entries WHERE key IN '
+                           '(SELECT key FROM entries ORDER BY used DESC LIMIT -1 OFFSET ?)', (self.maxsize,))
+
+
+class RedisBackend:
+    # Entries in Redis (or anything with the same commands, such as LocalRedis), shared by the
+    # whole fleet. Redis expires entries after the TTL; a sorted set of last-use times bounds
+    # the number of entries.
+
+    def __init__(self, client, ttl=SHARED_CACHE_TTL, maxsize=SHARED_CACHE_SIZE, prefix='shopping-trends:'):
+        self.client = client
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.prefix = prefix
+        self.usage = prefix + 'usage'
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is not None:
+            self.client.zadd(self.usage, {self.prefix + key: time.time()})
+        return value
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, value, ex=max(int(self.ttl), 1))
+        self.client.zadd(self.usage, {self.prefix + key: time.time()})
+        excess = self.client.zcard(self.usage) - self.maxsize
+        if excess > 0:
+            evicted = [member for member, _ in self.client.zpopmin(self.usage, excess)]
+            self.client.delete(*evicted)
+
+
+class LocalRedis:
+    # In-process stand-in for the Redis commands RedisBackend uses, for tests and single-process runs
+
+    def __init__(self):
+        self.values = {}
+        self.sorted_sets = {}
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        with self.lock:
+            value, expires = self.values.get(name, (None, None))
+            if expires is not None and expires <= time.time():
+                del self.values[name]
+                return None
+            return value
+
+    def set(self, name, value, ex=None):
+        with self.lock:
+            self.values[name] = (value, None if ex is None else time.time() + ex)
+
+    def delete(self, *names):
+        with self.lock:
+            for name in names:
+                self.values.pop(name, None)
+
+    def zadd(self, name, mapping):
+        with self.lock:
+            self.sorted_sets.setdefault(name, {}).update(mapping)
+
+    def zcard(self, name):
+        with self.lock:
+            return len(self.sorted_sets.get(name, {}))
+
+    def zpopmin(self, name, count=1):
+        with self.lock:
+            members = self.sorted_sets.get(name, {})
+            popped = sorted(members.items(), key=lambda item: item[1])[:count]
+            for member, _ in popped:
+                del members[member]
+            return popped
+
+
+def open_backend(url):
+    # '' disables the cache; sqlite:///path/to/file.db, redis://host:port/db or memory://
+    if not url:
+        return None
+    if url.startswith('sqlite:///'):
+        return SQLiteBackend(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        import redis
+        return RedisBackend(redis.Redis.from_url(url))
+    if url == 'memory://':
+        return RedisBackend(LocalRedis())
+    raise ValueError(f'Unsupported SHARED_CACHE_URL: {url}')
+
+
+class SharedCache:
+    # Aggregate tables shared between worker processes, keyed by the cube's dataset version and
+    # the call's arguments. A refreshed dataset has a new version, so its callers never see
+    # stale entries, which expire or are evicted in time.
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def key(self, name, version, arguments):
+        text = repr((name, version, sorted((key, freeze(value)) for key, value in arguments.items())))
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def load(self, key):
+        try:
+            value = self.backend.get(key)
+        except Exception:
+            logger.exception('Reading the shared aggregate cache failed')
+            return False, None
+        if value is None:
+            return False, None
+        return True, decode(value)
+
+    def store(self, key, value):
+        try:
+            self.backend.set(key, encode(value))
+        except Exception:
+            logger.exception('Writing the shared aggregate cache failed')
+
+    def memoize(self, method):
+        # Cache a method of an object with a `version` attribute that returns a DataFrame; free when no
+        # backend is configured
+        if self.backend is None:
+            return method
+        name = f'{method.__module__}.{method.__qualname__}'
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapper(instance, *args, **kwargs):
+            arguments = signature.bind(instance, *args, **kwargs)
+            arguments.apply_defaults()
+            del arguments.arguments['self']
+            key = self.key(name, instance.version, arguments.arguments)
+            found, value = self.load(key)
+            record_cache(found, cache='shared')
+            if not found:
+                value = method(instance, *args, **kwargs)
+                self.store(key, value)
+            return value
+
+        return wrapper
+
+
+# Shared by every cube in the process
+shared_cache = SharedCache(open_backend(SHARED_CACHE_URL))
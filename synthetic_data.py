@@ -0,0 +1,72 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from dataset import state_abbrev
+
+# Items sold in each category, and how often each category is bought
+ITEMS = {
+    'Clothing': ['Blouse', 'Sweater', 'Jeans', 'Shirt', 'Shorts', 'Dress', 'Skirt', 'Pants', 'Hoodie', 'T-shirt', 'Socks'],
+    'Footwear': ['Sandals', 'Sneakers', 'Shoes', 'Boots'],
+    'Outerwear': ['Coat', 'Jacket'],
+    'Accessories': ['Handbag', 'Sunglasses', 'Jewelry', 'Scarf', 'Hat', 'Backpack', 'Belt', 'Gloves'],
+}
+CATEGORY_SHARES = {'Clothing': 0.445, 'Footwear': 0.154, 'Outerwear': 0.083, 'Accessories': 0.318}
+
+SEASONS = ['Winter', 'Spring', 'Summer', 'Fall']
+SIZES = {'M': 0.45, 'L': 0.27, 'S': 0.17, 'XL': 0.11}
+COLORS = ['Gray', 'Maroon', 'Turquoise', 'White', 'Charcoal', 'Silver', 'Pink', 'Purple', 'Olive', 'Gold',
+          'Violet', 'Teal', 'Lavender', 'Black', 'Green', 'Peach', 'Red', 'Cyan', 'Brown', 'Beige',
+          'Orange', 'Indigo', 'Yellow', 'Magenta', 'Blue']
+SHIPPING_TYPES = ['Express', 'Free Shipping', 'Next Day Air', 'Standard', '2-Day Shipping', 'Store Pickup']
+PAYMENT_METHODS = ['Venmo', 'Cash', 'Credit Card', 'PayPal', 'Debit Card', 'Bank Transfer']
+FREQUENCIES = ['Fortnightly', 'Weekly', 'Annually', 'Quarterly', 'Bi-Weekly', 'Monthly', 'Every 3 Months']
+
+
+def generate(rows, seed=0, start_id=1):
+    # Transactions with the same columns and value ranges as shopping_trends_updated.csv
+    rng = np.random.default_rng(seed)
+    categories = rng.choice(list(CATEGORY_SHARES), rows, p=list(CATEGORY_SHARES.values()))
+    items = np.empty(rows, dtype=object)
+    for category, names in ITEMS.items():
+        chosen = categories == category
+        items[chosen] = rng.choice(names, chosen.sum())
+    discounted = rng.random(rows) < 0.43
+
+    return pd.DataFrame({
+        'Customer ID': np.arange(start_id, start_id + rows),
+        'Age': rng.integers(18, 71, rows),
+        'Gender': np.where(rng.random(rows) < 0.68, 'Male', 'Female'),
+        'Item Purchased': items,
+        'Category': categories,
+        'Purchase Amount (USD)': rng.integers(20, 101, rows),
+        'Location': rng.choice(list(state_abbrev), rows),
+        'Size': rng.choice(list(SIZES), rows, p=list(SIZES.values())),
+        'Color': rng.choice(COLORS, rows),
+        'Season': rng.choice(SEASONS, rows),
+        'Review Rating': rng.integers(25, 51, rows) / 10,
+        'Subscription Status': np.where(rng.random(rows) < 0.27, 'Yes', 'No'),
+        'Shipping Type': rng.choice(SHIPPING_TYPES, rows),
+        'Discount Applied': np.where(discounted, 'Yes', 'No'),
+        'Promo Code Used': np.where(discounted, 'Yes', 'No'),
+        'Previous Purchases': rng.integers(1, 51, rows),
+        'Payment Method': rng.choice(PAYMENT_METHODS, rows),
+        'Frequency of Purchases': rng.choice(FREQUENCIES, rows),
+    })
+
+
+def write_csv(path, rows, seed=0, chunksize=1_000_000):
+    # Write in chunks so tens of millions of rows never have to be held in memory at once
+    for start in range(0, rows, chunksize):
+        frame = generate(min(chunksize, rows - start), seed=seed + start, start_id=start + 1)
+        frame.to_csv(path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic shopping trends CSV.')
+    parser.add_argument('rows', type=int)
+    parser.add_argument('--output', default='shopping_trends_updated.csv')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_csv(args.output, args.rows, args.seed)
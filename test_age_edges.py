@@ -0,0 +1,20 @@
+import numpy as np
+
+from app_data import age_edges
+from cube import AGE_MEASURE, Cube
+from dataset import bins, prepare
+from synthetic_data import generate
+
+
+def test_edges_that_are_not_ages_are_ignored():
+    assert age_edges(5, '18, 99999999999999999999') == list(range(bins[0], bins[-1] + 5, 5))
+    assert age_edges(5, '18, 0150, 60, ' + '9' * 5000) == [18, 60, 150]
+
+
+def test_histogram_rolls_up_typed_edges():
+    frame = prepare(generate(500, seed=4))
+    histogram = Cube.from_frame(frame).age_histogram
+    result = histogram.rollup(['Age Group'], age_edges(5, '18, 150, 99999999999999999999'))
+    rated = frame[(frame['Age'] >= 18) & frame['Review Rating'].notna()]
+    assert list(result['Age Group']) == ['18-149']
+    assert np.isclose(result[AGE_MEASURE].iloc[0], rated['Review Rating'].mean())
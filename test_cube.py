@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cube import Cube
+from dataset import prepare
+from synthetic_data import generate
+
+# Filter combinations of seasons, state and genders, None meaning the filter is off
+FILTERS = [
+    (None, None, None),
+    (['Fall'], None, None),
+    (['Winter', 'Summer'], 'CA', None),
+    (None, None, ['Female']),
+    (['Spring', 'Fall'], 'TX', ['Male', 'Female']),
+    ([], None, None),
+]
+
+
+# Transactions including rows without a state, a gender or a rating
+@pytest.fixture(scope='module')
+def frame():
+    frame = generate(3000, seed=11)
+    rng = np.random.default_rng(11)
+    frame.loc[rng.choice(len(frame), 15, replace=False), 'Location'] = 'Puerto Rico'
+    frame.loc[rng.choice(len(frame), 15, replace=False), 'Gender'] = None
+    frame.loc[rng.choice(len(frame), 15, replace=False), 'Review Rating'] = np.nan
+    return prepare(frame)
+
+
+@pytest.fixture(scope='module')
+def cube(frame):
+    return Cube.from_frame(frame)
+
+
+def matching(frame, seasons, state, genders):
+    mask = np.ones(len(frame), dtype=bool)
+    if seasons is not None:
+        mask &= frame['Season'].isin(seasons).to_numpy()
+    if state:
+        mask &= (frame['state_abbr'] == state).to_numpy()
+    if genders is not None:
+        mask &= frame['Gender'].isin(genders).to_numpy()
+    return mask
+
+
+@pytest.mark.parametrize('seasons, state, genders', FILTERS)
+@pytest.mark.parametrize('by', [['Item Purchased', 'Category'], ['Location', 'state_abbr'], ['Age Group', 'Gender']])
+def test_rollup_matches_groupby_over_rows(frame, cube, by, seasons, state, genders):
+    result = cube.rollup(by, seasons=seasons, state=state, genders=genders,
+                         mean=['Review Rating', 'Purchase Amount (USD)'], total=['Previous Purchases'])
+    rows = frame[matching(frame, seasons, state, genders)]
+    expected = rows.groupby(by, observed=True).agg(**{
+        'Review Rating': ('Review Rating', 'mean'),
+        'Purchase Amount (USD)': ('Purchase Amount (USD)', 'mean'),
+        'Previous Purchases': ('Previous Purchases', 'sum'),
+    }).reset_index()
+    pd.testing.assert_frame_equal(result.sort_values(by, ignore_index=True), expected.sort_values(by, ignore_index=True),
+                                  check_categorical=False)
+
+
+@pytest.mark.parametrize('seasons, state, genders', FILTERS + [(['Fall'], 'PR', None), (None, 'NY', ['Female', 'Other'])])
+def test_index_intersection_matches_boolean_masks(cube, seasons, state, genders):
+    positions = cube.select(seasons, state, genders)
+    expected = np.flatnonzero(matching(cube.table, seasons, state, genders))
+    if positions is None:
+        assert len(expected) == len(cube.table)
+    else:
+        assert np.array_equal(positions, expected)
+        assert cube.subset(seasons, state, genders).table.equals(cube.table.take(expected).reset_index(drop=True))
@@ -0,0 +1,60 @@
+import io
+import threading
+
+import numpy as np
+import pytest
+
+import dataset
+from cube import Cube
+from dataset import aggregate_frame, prepare, stream_aggregate
+from synthetic_data import generate
+
+
+# Synthetic transactions including rows the state map, the gender and the rating do not cover
+@pytest.fixture(scope='module')
+def raw():
+    frame = generate(2000, seed=3)
+    rng = np.random.default_rng(3)
+    frame.loc[rng.choice(len(frame), 10, replace=False), 'Location'] = 'Puerto Rico'
+    frame.loc[rng.choice(len(frame), 10, replace=False), 'Gender'] = None
+    frame.loc[rng.choice(len(frame), 10, replace=False), 'Review Rating'] = np.nan
+    return frame
+
+
+def assert_identical(cube, expected):
+    assert cube.table.equals(expected.table)
+    assert list(cube.table.dtypes) == list(expected.table.dtypes)
+    assert cube.version == expected.version
+    assert cube.ages.axes == expected.ages.axes
+    assert np.array_equal(cube.ages.sums, expected.ages.sums)
+    assert np.array_equal(cube.ages.counts, expected.ages.counts)
+
+
+@pytest.mark.parametrize('workers', [2, 3, 16])
+def test_parallel_aggregation_matches_serial(raw, workers):
+    frame = prepare(raw.copy())
+    assert_identical(aggregate_frame(frame, workers=workers), Cube.from_frame(frame))
+
+
+@pytest.mark.parametrize('workers', [2, 3])
+def test_parallel_streaming_matches_serial(raw, workers):
+    csv = raw.to_csv(index=False)
+    expected = stream_aggregate(io.StringIO(csv), chunksize=300, workers=1)
+    assert_identical(stream_aggregate(io.StringIO(csv), chunksize=300, workers=workers), expected)
+
+
+def test_no_workers_are_forked_beside_other_threads(raw, monkeypatch):
+    def forbidden(workers):
+        raise AssertionError('forked a pool while another thread was running')
+    monkeypatch.setattr(dataset, 'aggregation_pool', forbidden)
+
+    frame = prepare(raw.copy())
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait)
+    thread.start()
+    try:
+        cube = aggregate_frame(frame, workers=3)
+    finally:
+        stop.set()
+        thread.join()
+    assert_identical(cube, Cube.from_frame(frame))
@@ -0,0 +1,49 @@
+import pytest
+
+from figure_cache import FigureCache, cache_key
+
+
+def test_figure_drawn_before_a_clear_is_not_stored():
+    cache = FigureCache(maxsize=8)
+    data = {'version': 1}
+
+    @cache.memoize
+    def chart(season):
+        drawn = f'{season} v{data["version"]}'
+        if data['version'] == 1:
+            # A refresh swaps the data and clears the cache while this figure is drawn
+            data['version'] = 2
+            cache.clear()
+        return drawn
+
+    assert chart('Fall') == 'Fall v1'
+    assert cache.info()['size'] == 0
+    assert chart('Fall') == 'Fall v2'
+    assert chart('Fall') == 'Fall v2'
+    assert cache.info()['hits'] == 1
+
+
+@pytest.mark.parametrize('empty', [[], (), '', None])
+def test_empty_selections_share_a_key(empty):
+    assert cache_key('chart', [empty, ['Fall', 'Winter']]) == cache_key('chart', [None, ['Winter', 'Fall', 'Fall']])
+
+
+def test_least_recently_used_figure_is_evicted():
+    cache = FigureCache(maxsize=2)
+    drawn = []
+
+    @cache.memoize
+    def chart(seasons, state):
+        drawn.append((seasons, state))
+        return f'{seasons} {state}'
+
+    chart(['Fall'], None)
+    chart(['Winter'], '')
+    # The same calls, spelled differently
+    assert chart(['Fall', 'Fall'], '') == "['Fall'] None"
+    chart(('Winter',), [])
+    chart(['Summer'], 'CA')
+    chart(['Winter'], None)
+    assert chart(['Fall'], None) == "['Fall'] None"
+    assert drawn == [(['Fall'], None), (['Winter'], ''), (['Summer'], 'CA'), (['Fall'], None)]
+    assert cache.info() == {'hits': 3, 'misses': 4, 'size': 2, 'maxsize': 2}
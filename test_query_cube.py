@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cube import Cube
+from dataset import prepare
+from query_cube import open_query_cube
+from synthetic_data import generate
+from test_cube import FILTERS
+
+GROUPINGS = [['Item Purchased', 'Category'], ['Location', 'state_abbr'], ['Season'], ['Age Group', 'Gender']]
+
+
+# Transactions including rows without a state, a gender or a rating, as a CSV and as the pandas cube
+@pytest.fixture(scope='module')
+def source(tmp_path_factory):
+    frame = generate(2000, seed=12)
+    rng = np.random.default_rng(12)
+    frame.loc[rng.choice(len(frame), 10, replace=False), 'Location'] = 'Puerto Rico'
+    frame.loc[rng.choice(len(frame), 10, replace=False), 'Gender'] = None
+    frame.loc[rng.choice(len(frame), 10, replace=False), 'Review Rating'] = np.nan
+    path = str(tmp_path_factory.mktemp('query') / 'transactions.csv')
+    frame.to_csv(path, index=False)
+    return path, Cube.from_frame(prepare(pd.read_csv(path)))
+
+
+@pytest.fixture(scope='module', params=['sqlite', 'duckdb'])
+def cubes(request, source):
+    if request.param == 'duckdb':
+        pytest.importorskip('duckdb')
+    path, cube = source
+    return open_query_cube(path, request.param), cube
+
+
+def assert_same_rollup(result, expected, by):
+    pd.testing.assert_frame_equal(result.sort_values(by, ignore_index=True), expected.sort_values(by, ignore_index=True),
+                                  check_dtype=False, check_categorical=False)
+
+
+@pytest.mark.parametrize('seasons, state, genders', FILTERS)
+@pytest.mark.parametrize('by', GROUPINGS)
+def test_rollups_match_the_pandas_cube(cubes, by, seasons, state, genders):
+    query_cube, cube = cubes
+    options = dict(seasons=seasons, state=state, genders=genders,
+                   mean=['Review Rating', 'Purchase Amount (USD)'], total=['Previous Purchases'])
+    assert_same_rollup(query_cube.rollup(by, **options), cube.rollup(by, **options), by)
+    subset_options = dict(mean=['Review Rating'], total=['Purchase Amount (USD)'])
+    assert_same_rollup(query_cube.subset(seasons, state, genders).rollup(by, **subset_options),
+                       cube.subset(seasons, state, genders).rollup(by, **subset_options), by)
+
+
+def test_seasons_and_age_groups_match_the_pandas_cube(cubes):
+    query_cube, cube = cubes
+    assert query_cube.seasons() == cube.seasons()
+    for filters in FILTERS:
+        histograms = query_cube.subset(*filters).age_histogram, cube.subset(*filters).age_histogram
+        result, expected = (histogram.rollup(['Gender', 'Age Group'], [18, 30, 45, 70]) for histogram in histograms)
+        pd.testing.assert_frame_equal(result, expected)
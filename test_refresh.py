@@ -0,0 +1,35 @@
+import pytest
+
+import dataset
+import refresh
+from synthetic_data import generate
+
+
+def rows_counted(cube):
+    return int(cube.table['Purchase Amount (USD) count'].sum())
+
+
+@pytest.mark.parametrize('chunksize', [0, 500])
+def test_rows_appended_during_the_initial_load_are_counted_once(tmp_path, monkeypatch, chunksize):
+    monkeypatch.chdir(tmp_path)
+    generate(1200, seed=5).to_csv('data.csv', index=False)
+    appended = generate(250, seed=6, start_id=1201).to_csv(index=False, header=False)
+    lines = appended.splitlines(keepends=True)
+    # 200 complete rows, then a row cut off mid-line
+    during, partial, rest = ''.join(lines[:200]), lines[200][:10], lines[200][10:] + ''.join(lines[201:])
+
+    def load_cube(csv_path, **options):
+        with open(csv_path, 'a') as file:
+            file.write(during + partial)
+        return dataset.load_cube(csv_path, cache_path='data.parquet', chunksize=chunksize, **options)
+
+    monkeypatch.setattr(refresh, 'load_cube', load_cube)
+    refresher = refresh.Refresher('data.csv', batch_dir=None)
+    # The load stops where the file ended when it started; the refresh folds the complete rows
+    # appended during it and leaves the partial row for later
+    assert rows_counted(refresher.cube) == 1400
+
+    with open('data.csv', 'a') as file:
+        file.write(rest)
+    assert refresher.refresh()
+    assert rows_counted(refresher.cube) == 1450
@@ -0,0 +1,107 @@
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import shared_cache
+from shared_cache import LocalRedis, RedisBackend, SharedCache, SQLiteBackend
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Both backends date their entries with time.time(), which the tests move on by hand
+    now = types.SimpleNamespace(value=1_000_000.0)
+    monkeypatch.setattr(shared_cache, 'time', types.SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+@pytest.fixture(params=['redis', 'sqlite'])
+def backend(request, tmp_path, clock):
+    def open_backend(ttl=60, maxsize=100):
+        if request.param == 'redis':
+            return RedisBackend(LocalRedis(), ttl=ttl, maxsize=maxsize)
+        return SQLiteBackend(str(tmp_path / 'cache.db'), ttl=ttl, maxsize=maxsize)
+    return open_backend
+
+
+def table_type(cache):
+    # Stands in for a cube: a dataset version and a memoized roll-up that counts its calls
+    class Table:
+        def __init__(self, version):
+            self.version = version
+            self.calls = 0
+
+        @cache.memoize
+        def rollup(self, by, seasons=None):
+            self.calls += 1
+            return pd.DataFrame({'Season': list(seasons or ['Fall']), 'rows': self.calls})
+
+    return Table
+
+
+def test_repeated_calls_are_served_from_the_backend(backend):
+    cache = SharedCache(backend())
+    table = table_type(cache)('v1')
+    first = table.rollup(['Season'], seasons=['Fall', 'Winter'])
+    # A list and a tuple of the same seasons are the same call
+    pd.testing.assert_frame_equal(table.rollup(['Season'], ('Fall', 'Winter')), first)
+    assert table.calls == 1
+    table.rollup(['Season'], seasons=['Spring'])
+    assert table.calls == 2
+
+
+def test_a_new_version_is_not_served_the_old_entries(backend):
+    cache = SharedCache(backend())
+    Table = table_type(cache)
+    old, new = Table('v1'), Table('v2')
+    old.rollup(['Season'])
+    new.rollup(['Season'])
+    assert new.calls == 1
+    old.rollup(['Season'])
+    assert old.calls == 1
+
+
+def test_entries_expire_after_the_ttl(backend, clock):
+    cache = SharedCache(backend(ttl=60))
+    table = table_type(cache)('v1')
+    table.rollup(['Season'])
+    clock.value += 59
+    table.rollup(['Season'])
+    assert table.calls == 1
+    clock.value += 2
+    table.rollup(['Season'])
+    assert table.calls == 2
+
+
+def test_least_recently_used_entries_are_evicted(backend, clock):
+    cache = SharedCache(backend(maxsize=2))
+    table = table_type(cache)('v1')
+    for season in ['Fall', 'Winter']:
+        table.rollup(['Season'], seasons=[season])
+        clock.value += 1
+    # Using Fall again leaves Winter the least recently used when Spring is stored
+    table.rollup(['Season'], seasons=['Fall'])
+    clock.value += 1
+    table.rollup(['Season'], seasons=['Spring'])
+    clock.value += 1
+    assert table.calls == 3
+    table.rollup(['Season'], seasons=['Fall'])
+    assert table.calls == 3
+    table.rollup(['Season'], seasons=['Winter'])
+    assert table.calls == 4
+
+
+@pytest.mark.parametrize('rows', [slice(None), slice(0)])
+def test_tables_keep_their_types_through_the_backend(backend, rows):
+    frame = pd.DataFrame({
+        'Season': pd.Categorical(['Fall', 'Winter', 'Fall'], categories=['Fall', 'Spring', 'Winter']),
+        'Age Group': pd.Categorical(['15-19', '20-24', None], categories=['15-19', '20-24', '25-29'], ordered=True),
+        'Review Rating': [3.5, np.nan, 4.25],
+        'Previous Purchases count': np.array([2, 0, 7], dtype='int64'),
+    }, index=pd.Index(['a', 'b', 'c'], name='key')).iloc[rows]
+    cache = SharedCache(backend())
+    cache.store('table', frame)
+    found, value = cache.load('table')
+    assert found
+    pd.testing.assert_frame_equal(value, frame)